@@ -0,0 +1,116 @@
+import asyncio
+import logging
+import math
+import os
+from typing import Dict
+import psutil
+from fastapi import Depends, HTTPException
+from sqlalchemy import func, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.auth import get_current_user
+from app.db import get_session
+from app.models import AdmissionBucket
+
+logger = logging.getLogger(__name__)
+# Each user gets a bucket of ADMISSION_BURST tokens refilled at ADMISSION_REFILL_PER_MIN;
+# a request spends its route's cost, so one analyze weighs as much as several cheap reads.
+# Buckets live in Postgres, so these limits hold per user across all workers and replicas.
+ADMISSION_BURST = float(os.getenv("ADMISSION_BURST", "30"))
+ADMISSION_REFILL_PER_MIN = float(os.getenv("ADMISSION_REFILL_PER_MIN", "20"))
+COSTS: Dict[str, float] = {
+    "analyze": float(os.getenv("ADMISSION_COST_ANALYZE", "10")),
+    "github": float(os.getenv("ADMISSION_COST_GITHUB", "5")),
+    "recommendations": float(os.getenv("ADMISSION_COST_RECOMMENDATIONS", "2")),
+    "history": float(os.getenv("ADMISSION_COST_HISTORY", "1")),
+}
+HEAVY_ROUTES = {"analyze", "recommendations"}  # routes that run the encoder
+# Load shedding is per worker process: each worker admits up to MAX_INFLIGHT_INFERENCE encoder requests
+# of its own (a host runs UVICORN_WORKERS x this), and sheds on the host-wide CPU reading.
+MAX_INFLIGHT_INFERENCE = int(os.getenv("MAX_INFLIGHT_INFERENCE", "4"))
+CPU_SHED_PERCENT = float(os.getenv("CPU_SHED_PERCENT", "90"))
+REFILL_PER_SECOND = ADMISSION_REFILL_PER_MIN / 60
+BUCKETS = AdmissionBucket.__table__
+
+# Refill and spend in one statement; the row is only written when the request is admitted,
+# so RETURNING yields nothing for a rejected request. Row locks serialize a user's concurrent requests.
+_REFILLED = func.least(
+    ADMISSION_BURST,
+    BUCKETS.c.tokens + func.extract("epoch", func.now() - BUCKETS.c.updated) * REFILL_PER_SECOND,
+)
+
+def _take_statement(user_id: str, cost: float):
+    stmt = pg_insert(BUCKETS).values(user_id=user_id, tokens=ADMISSION_BURST - cost, updated=func.now())
+    return stmt.on_conflict_do_update(
+        index_elements=[BUCKETS.c.user_id],
+        set_={"tokens": _REFILLED - cost, "updated": func.now()},
+        where=_REFILLED >= cost,
+    ).returning(BUCKETS.c.tokens)
+
+async def take(session: AsyncSession, user_id: str, cost: float) -> float:
+    """Spend `cost` tokens from the user's shared bucket; returns 0 when admitted, otherwise the seconds until enough have refilled."""
+    admitted = (await session.execute(_take_statement(user_id, cost))).first()
+    if admitted is None:
+        tokens = (await session.execute(select(_REFILLED).where(BUCKETS.c.user_id == user_id))).scalar()
+    await session.commit()
+    if admitted is not None:
+        return 0.0
+    return (cost - tokens) / REFILL_PER_SECOND if REFILL_PER_SECOND > 0 else 60.0
+
+_inflight = 0
+_cpu_percent = 0.0
+_rejected = {"rate_limited": 0, "shed": 0}
+
+def _shed_reason():
+    if _inflight >= MAX_INFLIGHT_INFERENCE:
+        return f"{_inflight} inference requests in flight"
+    if _cpu_percent >= CPU_SHED_PERCENT:
+        return f"CPU at {_cpu_percent:.0f}%"
+    return None
+
+def admit(route: str):
+    """Route dependency: shared per-user weighted token bucket, plus per-worker load shedding on routes that run inference."""
+    cost = COSTS[route]
+    heavy = route in HEAVY_ROUTES
+
+    async def dependency(current_user: dict = Depends(get_current_user), session: AsyncSession = Depends(get_session)):
+        global _inflight
+        if heavy:
+            reason = _shed_reason()
+            if reason:
+                _rejected["shed"] += 1
+                logger.warning(f"Shedding {route} for user {current_user['id']}: {reason}")
+                raise HTTPException(status_code=503, detail="Server busy, please retry", headers={"Retry-After": "5"})
+        wait = await take(session, str(current_user["id"]), cost)
+        if wait > 0:
+            _rejected["rate_limited"] += 1
+            raise HTTPException(
+                status_code=429,
+                detail="Rate limit exceeded",
+                headers={"Retry-After": str(math.ceil(wait))},
+            )
+        if not heavy:
+            yield
+            return
+        _inflight += 1
+        try:
+            yield
+        finally:
+            _inflight -= 1
+
+    return dependency
+
+def stats() -> dict:
+    return {
+        "inflight_inference": _inflight,
+        "cpu_percent": _cpu_percent,
+        "rejected": dict(_rejected),
+    }
+
+async def sample_cpu(interval: float = 2.0) -> None:
+    """Background loop keeping a smoothed CPU reading, so admission never blocks on psutil sampling."""
+    global _cpu_percent
+    psutil.cpu_percent(interval=None)
+    while True:
+        await asyncio.sleep(interval)
+        _cpu_percent = 0.5 * _cpu_percent + 0.5 * psutil.cpu_percent(interval=None)
@@ -54,6 +54,7 @@ async def get_current_user(token: str = Depends(oauth2_scheme)) -> Dict[str, Any
         return payload
     except JWTError as e:
         logger.error("JWT decode failed: %s", e)
+        raise credentials_exception
 def validate_github_token_and_get_user(github_token: str, require_scopes: Optional[list] = None) -> Dict[str, Any]:
     """
     Validate a GitHub access token (PAT or OAuth token) by calling GET /user.
@@ -0,0 +1,439 @@
+import argparse
+import asyncio
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import shutil
+from array import array
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+import numpy as np
+from fastapi import HTTPException
+from sqlalchemy import and_, bindparam, func, or_, select, text, update
+from app import encoders
+from app.db import AsyncSessionLocal, engine, init_db
+from app.models import Job
+
+logger = logging.getLogger(__name__)
+ROOT = Path(__file__).resolve().parent.parent
+SEED_FILE = ROOT / "jobs.json"
+ARTIFACT_DIR = Path(os.getenv("ARTIFACT_DIR", str(ROOT / "artifacts")))
+CATALOG_POLL_SECONDS = float(os.getenv("CATALOG_POLL_SECONDS", "60"))
+IMPORT_BATCH_SIZE = int(os.getenv("CATALOG_IMPORT_BATCH", "5000"))
+EMBED_BATCH_SIZE = int(os.getenv("CATALOG_EMBED_BATCH", "256"))
+BUILD_BATCH_SIZE = int(os.getenv("CATALOG_BUILD_BATCH", "2000"))
+ARTIFACT_VERSIONS_KEPT = int(os.getenv("CATALOG_VERSIONS_KEPT", "3"))
+SEARCH_BLOCK_ELEMENTS = int(os.getenv("CATALOG_SEARCH_BLOCK", str(1024 * 1024)))  # distance cells per search chunk
+JOBS_TABLE = Job.__table__
+
+STAGING_COLUMNS = ["external_id", "title", "company", "description", "required_skills", "salary_range", "content_hash"]
+STAGING_DDL = """
+CREATE TEMP TABLE job_staging (
+    external_id TEXT, title TEXT, company TEXT, description TEXT,
+    required_skills JSONB, salary_range TEXT, content_hash TEXT
+) ON COMMIT DROP
+"""
+# Unchanged postings are skipped entirely; changed ones lose their embedding so embed_missing() re-encodes them
+UPSERT_SQL = """
+INSERT INTO job (external_id, title, company, description, required_skills, salary_range, content_hash, active, updated_at)
+SELECT DISTINCT ON (external_id)
+    external_id, title, company, description, required_skills, salary_range, content_hash, TRUE, now() AT TIME ZONE 'utc'
+FROM job_staging
+ORDER BY external_id
+ON CONFLICT (external_id) DO UPDATE SET
+    title = EXCLUDED.title,
+    company = EXCLUDED.company,
+    description = EXCLUDED.description,
+    required_skills = EXCLUDED.required_skills,
+    salary_range = EXCLUDED.salary_range,
+    embedding = CASE WHEN job.content_hash IS DISTINCT FROM EXCLUDED.content_hash THEN NULL ELSE job.embedding END,
+    content_hash = EXCLUDED.content_hash,
+    active = TRUE,
+    updated_at = EXCLUDED.updated_at
+WHERE job.content_hash IS DISTINCT FROM EXCLUDED.content_hash OR NOT job.active
+"""
+PRUNE_SQL = """
+UPDATE job SET active = FALSE, updated_at = now() AT TIME ZONE 'utc'
+WHERE active AND NOT EXISTS (SELECT 1 FROM job_staging s WHERE s.external_id = job.external_id)
+"""
+
+class CatalogNotReady(HTTPException):
+    def __init__(self):
+        super().__init__(status_code=503, detail="Job catalog is still loading", headers={"Retry-After": "5"})
+
+class CatalogSnapshot:
+    """Read-only view of one catalog version, memory-mapped from ARTIFACT_DIR/<version>.
+
+    Every worker maps the same files, so codes, ids and job text live once in the page cache;
+    job records are decoded only when a request reads them.
+    """
+
+    def __init__(self, version: str, path: Path):
+        self.version = version
+        self.codes = np.load(path / "codes.npy", mmap_mode="r")  # float32 binary codes of active jobs, in search order
+        self.norms = np.load(path / "norms.npy", mmap_mode="r")  # squared L2 norm of each code
+        self.rows = np.load(path / "rows.npy", mmap_mode="r")  # search position -> record number
+        self.ids = np.load(path / "ids.npy", mmap_mode="r")  # record number -> job id (ascending, inactive jobs included)
+        self.offsets = np.load(path / "offsets.npy", mmap_mode="r")
+        self.records = _map_bytes(path / "records.bin")  # JSON job records, back to back
+        self.skill_offsets = np.load(path / "skill_offsets.npy", mmap_mode="r")
+        self.skill_rows = np.load(path / "skill_rows.npy", mmap_mode="r")  # search positions per skill
+        self.skills = json.loads((path / "skills.json").read_text())
+        self._skill_index = {skill: i for i, skill in enumerate(self.skills)}
+        self.all_required = set(self.skills)
+
+    @property
+    def size(self) -> int:
+        return len(self.rows)
+
+    def _record(self, n: int) -> Dict[str, Any]:
+        return json.loads(self.records[int(self.offsets[n]):int(self.offsets[n + 1])].tobytes())
+
+    def job_at(self, position: int) -> Dict[str, Any]:
+        """The active job at a search position."""
+        return self._record(int(self.rows[position]))
+
+    def get(self, job_id: int) -> Optional[Dict[str, Any]]:
+        """Any job by id, including postings deactivated since stored analyses referenced them."""
+        n = int(np.searchsorted(self.ids, job_id))
+        return self._record(n) if n < len(self.ids) and self.ids[n] == job_id else None
+
+    def jobs_with_skill(self, skill: str, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        i = self._skill_index.get(skill)
+        if i is None:
+            return []
+        positions = self.skill_rows[int(self.skill_offsets[i]):int(self.skill_offsets[i + 1])][:limit]
+        return [self.job_at(p) for p in positions]
+
+    def search(self, queries: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Exact L2 search straight over the mapped codes (faiss IndexFlatL2 semantics, ties in any order)."""
+        q = np.asarray(queries, dtype=np.float32)
+        distances = np.full((len(q), k), np.finfo(np.float32).max, dtype=np.float32)
+        labels = np.full((len(q), k), -1, dtype=np.int64)
+        q_norms = (q * q).sum(axis=1)[:, None]
+        chunk = max(1024, SEARCH_BLOCK_ELEMENTS // max(1, len(q)))
+        for start in range(0, self.size, chunk):
+            x = self.codes[start:start + chunk]
+            d = q_norms - 2 * (q @ x.T) + self.norms[start:start + chunk][None, :]
+            kk = min(k, len(x))
+            part = np.argpartition(d, kk - 1, axis=1)[:, :kk]
+            cand_d = np.concatenate([distances, np.take_along_axis(d, part, axis=1)], axis=1)
+            cand_i = np.concatenate([labels, part + start], axis=1)
+            order = np.argsort(cand_d, axis=1, kind="stable")[:, :k]
+            distances = np.take_along_axis(cand_d, order, axis=1)
+            labels = np.take_along_axis(cand_i, order, axis=1)
+        return distances, labels
+
+_CURRENT: Optional[CatalogSnapshot] = None
+_STAMP = None
+_REFRESH_LOCK = asyncio.Lock()
+
+def current() -> CatalogSnapshot:
+    """The live snapshot. Callers should read it once per request so index and job list stay consistent."""
+    if _CURRENT is None:
+        raise CatalogNotReady()
+    return _CURRENT
+
+def peek() -> Optional[CatalogSnapshot]:
+    return _CURRENT
+
+def _content_hash(record: Dict[str, Any]) -> str:
+    payload = json.dumps(
+        [record["title"], record["company"], record["description"], record["required_skills"], record["salary_range"]],
+        sort_keys=True,
+    )
+    return hashlib.sha1(payload.encode()).hexdigest()
+
+def _normalize(raw: Dict[str, Any]) -> Dict[str, Any]:
+    """Map a feed entry (jobs.json shape) to staging columns; entries without an id are keyed by their content."""
+    record = {
+        "title": raw.get("title", "Unknown"),
+        "company": raw.get("company", "Unknown"),
+        "description": raw.get("description", ""),
+        "required_skills": list(raw.get("requiredSkills", raw.get("required_skills", []))),
+        "salary_range": raw.get("salaryRange", raw.get("salary_range")),
+    }
+    record["content_hash"] = _content_hash(record)
+    external_id = raw.get("id") or raw.get("external_id")
+    if external_id is None:
+        key = f"{record['title']}|{record['company']}|{record['description']}"
+        external_id = hashlib.sha1(key.encode()).hexdigest()[:16]
+    record["external_id"] = str(external_id)
+    record["required_skills"] = json.dumps(record["required_skills"])
+    return record
+
+def read_feed(path: Path) -> Iterator[Dict[str, Any]]:
+    """Yield job entries from a JSON array or a JSON-lines file."""
+    with open(path) as f:
+        head = f.read(1)
+        while head and head.isspace():
+            head = f.read(1)
+        f.seek(0)
+        if head == "[":
+            yield from json.load(f)
+            return
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+def _batches(items: Iterable[Any], size: int) -> Iterator[List[Any]]:
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+async def bulk_import(entries: Iterable[Dict[str, Any]], batch_size: int = IMPORT_BATCH_SIZE, prune: bool = False) -> Dict[str, int]:
+    """COPY the feed into a staging table in batches, then upsert it into job in one statement."""
+    received = 0
+    async with engine.begin() as conn:
+        await conn.execute(text(STAGING_DDL))
+        driver = (await conn.get_raw_connection()).driver_connection
+        for batch in _batches((_normalize(e) for e in entries), batch_size):
+            await driver.copy_records_to_table(
+                "job_staging",
+                records=[tuple(r[c] for c in STAGING_COLUMNS) for r in batch],
+                columns=STAGING_COLUMNS,
+            )
+            received += len(batch)
+        changed = (await conn.execute(text(UPSERT_SQL))).rowcount
+        pruned = (await conn.execute(text(PRUNE_SQL))).rowcount if prune else 0
+    stats = {"received": received, "changed": changed, "deactivated": pruned}
+    logger.info(f"Catalog import: {stats}")
+    return stats
+
+async def seed_if_empty() -> None:
+    async with AsyncSessionLocal() as session:
+        count = (await session.execute(select(func.count()).select_from(JOBS_TABLE))).scalar_one()
+    if not count:
+        logger.info(f"Job table is empty, seeding from {SEED_FILE.name}")
+        await bulk_import(read_feed(SEED_FILE))
+
+def _pending_embedding():
+    """Active postings with no stored embedding for the current backend."""
+    backend = encoders.ENCODER_BACKEND
+    return and_(
+        JOBS_TABLE.c.active,
+        or_(JOBS_TABLE.c.embedding.is_(None), JOBS_TABLE.c.embedding_backend.is_distinct_from(backend)),
+    )
+
+async def pending_embeddings() -> int:
+    async with AsyncSessionLocal() as session:
+        return (await session.execute(select(func.count()).select_from(JOBS_TABLE).where(_pending_embedding()))).scalar_one()
+
+async def embed_missing(batch_size: int = EMBED_BATCH_SIZE) -> int:
+    """Encode active postings with no embedding for the current backend and store them (float32, normalized)."""
+    from app.utils import get_model
+    backend = encoders.ENCODER_BACKEND
+    store = (
+        update(JOBS_TABLE)
+        .where(JOBS_TABLE.c.id == bindparam("_id"))
+        .values(embedding=bindparam("_embedding"), embedding_backend=backend)
+    )
+    model = None
+    total = 0
+    async with AsyncSessionLocal() as session:
+        while True:
+            stmt = (
+                select(JOBS_TABLE.c.id, JOBS_TABLE.c.description)
+                .where(_pending_embedding())
+                .order_by(JOBS_TABLE.c.id)
+                .limit(batch_size)
+            )
+            rows = (await session.execute(stmt)).all()
+            if not rows:
+                break
+            model = model or await asyncio.to_thread(get_model)
+            emb = await asyncio.to_thread(model.encode, [r.description for r in rows], True)
+            params = [{"_id": r.id, "_embedding": e.astype(np.float32).tobytes()} for r, e in zip(rows, emb)]
+            await session.execute(store, params)
+            await session.commit()
+            total += len(rows)
+    if total:
+        logger.info(f"Embedded {total} new or changed postings")
+    return total
+
+def _map_bytes(path: Path) -> np.ndarray:
+    return np.memmap(path, dtype=np.uint8, mode="r") if path.stat().st_size else np.zeros(0, dtype=np.uint8)
+
+VERSION_SQL = """
+SELECT md5(coalesce(string_agg(id::text || ':' || coalesce(content_hash, '') || ':' || active::text, ',' ORDER BY id), ''))
+FROM job
+"""
+
+async def _version() -> str:
+    """Catalog version computed in Postgres, so workers never pull job rows just to learn nothing changed."""
+    async with AsyncSessionLocal() as session:
+        digest = (await session.execute(text(VERSION_SQL))).scalar_one()
+    return f"{encoders.ENCODER_BACKEND}.{digest[:12]}"
+
+async def _write_artifacts(path: Path, encode_missing: bool = True) -> int:
+    """Stream every job row once, writing records, ids, codes and skill postings into `path`.
+
+    With encode_missing=False a posting without a stored embedding for the current backend is an error, not an encoder call.
+    """
+    backend = encoders.ENCODER_BACKEND
+    ids, offsets, rows, codes = array("q"), array("q", [0]), array("q"), []
+    postings: Dict[str, array] = {}
+    stmt = select(
+        JOBS_TABLE.c.id,
+        JOBS_TABLE.c.title,
+        JOBS_TABLE.c.company,
+        JOBS_TABLE.c.description,
+        JOBS_TABLE.c.required_skills,
+        JOBS_TABLE.c.salary_range,
+        JOBS_TABLE.c.active,
+        JOBS_TABLE.c.embedding,
+        JOBS_TABLE.c.embedding_backend,
+    ).order_by(JOBS_TABLE.c.id)
+    with open(path / "records.bin", "wb") as records:
+        async with engine.connect() as conn:
+            result = await conn.stream(stmt)
+            async for batch in result.partitions(BUILD_BATCH_SIZE):
+                vectors = []
+                for r in batch:
+                    record = {
+                        "id": r.id,
+                        "title": r.title,
+                        "company": r.company,
+                        "description": r.description,
+                        "requiredSkills": r.required_skills or [],
+                        "salaryRange": r.salary_range or "Unknown",
+                    }
+                    offsets.append(offsets[-1] + records.write(json.dumps(record).encode()))
+                    ids.append(r.id)
+                    if not r.active:
+                        continue
+                    for skill in record["requiredSkills"]:
+                        postings.setdefault(skill, array("q")).append(len(rows))
+                    rows.append(len(ids) - 1)
+                    stored = r.embedding is not None and r.embedding_backend == backend
+                    vectors.append(np.frombuffer(r.embedding, dtype=np.float32) if stored else r.description)
+                missing = [i for i, v in enumerate(vectors) if isinstance(v, str)]
+                if missing and not encode_missing:
+                    raise RuntimeError(f"{len(missing)} active postings have no {backend} embedding; run `python -m app.catalog embed` first")
+                if missing:
+                    from app.utils import get_model
+                    encoded = await asyncio.to_thread(get_model().encode, [vectors[i] for i in missing], True)
+                    for i, v in zip(missing, encoded):
+                        vectors[i] = v
+                    logger.info(f"Encoded {len(missing)} postings without stored embeddings")
+                if vectors:
+                    codes.append(encoders.quantize_binary(np.vstack(vectors)).astype(np.float32))
+    matrix = np.vstack(codes) if codes else np.zeros((0, encoders.EMBEDDING_DIM // 8), dtype=np.float32)
+    np.save(path / "codes.npy", matrix)
+    np.save(path / "norms.npy", (matrix * matrix).sum(axis=1))
+    np.save(path / "rows.npy", np.frombuffer(rows, dtype=np.int64))
+    np.save(path / "ids.npy", np.frombuffer(ids, dtype=np.int64))
+    np.save(path / "offsets.npy", np.frombuffer(offsets, dtype=np.int64))
+    skills = sorted(postings)
+    skill_offsets = np.cumsum([0] + [len(postings[s]) for s in skills], dtype=np.int64)
+    skill_rows = np.concatenate([np.frombuffer(postings[s], dtype=np.int64) for s in skills]) if skills else np.zeros(0, np.int64)
+    np.save(path / "skill_offsets.npy", skill_offsets)
+    np.save(path / "skill_rows.npy", skill_rows)
+    (path / "skills.json").write_text(json.dumps(skills))
+    return len(rows)
+
+def _prune_artifacts(keep: str) -> None:
+    """Drop all but the newest versions; workers still mapping a removed version keep their open files."""
+    versions = sorted((p for p in ARTIFACT_DIR.iterdir() if p.is_dir() and not p.name.startswith(".")), key=lambda p: p.stat().st_mtime)
+    for old in versions[:-ARTIFACT_VERSIONS_KEPT]:
+        if old.name != keep:
+            shutil.rmtree(old, ignore_errors=True)
+    for legacy in ARTIFACT_DIR.glob("job_*.*"):  # single-file artifacts from the faiss layout
+        legacy.unlink(missing_ok=True)
+
+async def build_artifacts(version: str, encode_missing: bool = True) -> Path:
+    """Write ARTIFACT_DIR/<version> once: the first process to take the lock builds it, the rest wait and map it."""
+    path = ARTIFACT_DIR / version
+    if path.exists():
+        return path
+    ARTIFACT_DIR.mkdir(parents=True, exist_ok=True)
+    with open(ARTIFACT_DIR / ".build.lock", "w") as lock:
+        await asyncio.to_thread(fcntl.flock, lock, fcntl.LOCK_EX)
+        try:
+            if path.exists():
+                return path
+            tmp = ARTIFACT_DIR / f".{version}.{os.getpid()}.tmp"
+            shutil.rmtree(tmp, ignore_errors=True)
+            tmp.mkdir()
+            try:
+                count = await _write_artifacts(tmp, encode_missing)
+                os.replace(tmp, path)
+            finally:
+                shutil.rmtree(tmp, ignore_errors=True)
+            logger.info(f"Wrote catalog artifacts {version} ({count} active jobs)")
+            _prune_artifacts(keep=version)
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+    return path
+
+async def _stamp():
+    async with AsyncSessionLocal() as session:
+        stmt = select(func.count(), func.max(JOBS_TABLE.c.updated_at)).select_from(JOBS_TABLE)
+        return tuple((await session.execute(stmt)).one())
+
+async def refresh(encode_missing: bool = True) -> bool:
+    """Map the current catalog version (building its artifacts if needed) and swap it in; requests keep the snapshot they hold."""
+    global _CURRENT, _STAMP
+    async with _REFRESH_LOCK:
+        stamp = await _stamp()
+        version = await _version()
+        if _CURRENT is not None and _CURRENT.version == version:
+            _STAMP = stamp
+            return False
+        path = await build_artifacts(version, encode_missing)
+        snapshot = await asyncio.to_thread(CatalogSnapshot, version, path)
+        _CURRENT, _STAMP = snapshot, stamp
+        logger.info(f"Catalog snapshot {version} live with {snapshot.size} jobs")
+        return True
+
+async def watch_catalog() -> None:
+    """Background loop: a cheap count/max(updated_at) probe, and a full rebuild only when it changes."""
+    while True:
+        await asyncio.sleep(CATALOG_POLL_SECONDS)
+        try:
+            if await _stamp() != _STAMP:
+                # never encode in a serving process: postings still being embedded by an import fail this
+                # build (leaving _STAMP unchanged) and the next poll retries once embed_missing has stored them
+                await refresh(encode_missing=False)
+        except Exception as e:
+            logger.error(f"Catalog refresh failed: {str(e)}")
+
+async def prepare() -> None:
+    """Seed, embed and write the shared artifacts ahead of traffic; optional, workers build them on warm-up otherwise."""
+    await init_db()
+    await seed_if_empty()
+    await embed_missing()
+    await refresh()
+
+async def _main(args) -> None:
+    await init_db()
+    if args.command == "import":
+        await bulk_import(read_feed(Path(args.feed)), batch_size=args.batch, prune=args.prune)
+        await embed_missing()
+        if args.rescore:
+            from app.rescore import rescore_all
+            await rescore_all()
+    elif args.command == "embed":
+        await embed_missing()
+    else:
+        await prepare()
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Manage the database-backed job catalog")
+    sub = parser.add_subparsers(dest="command", required=True)
+    imp = sub.add_parser("import", help="bulk load a JSON or JSON-lines job feed")
+    imp.add_argument("feed")
+    imp.add_argument("--batch", type=int, default=IMPORT_BATCH_SIZE)
+    imp.add_argument("--prune", action="store_true", help="deactivate postings missing from the feed")
+    imp.add_argument("--rescore", action="store_true", help="re-match stored analyses against the new catalog")
+    sub.add_parser("embed", help="encode postings that have no embedding yet")
+    sub.add_parser("prepare", help="seed, embed and build the serving artifacts")
+    asyncio.run(_main(parser.parse_args()))
@@ -8,7 +8,16 @@ load_dotenv(dotenv_path=os.path.join(os.path.dirname(os.path.dirname(__file__)),
 DATABASE_URL = os.getenv("DATABASE_URL")
 if not DATABASE_URL:
     raise ValueError("DATABASE_URL not set in .env")
-engine = create_async_engine(DATABASE_URL, echo=True, future=True)
+SQL_ECHO = os.getenv("SQL_ECHO", "false").lower() in ("1", "true", "yes")
+engine = create_async_engine(
+    DATABASE_URL,
+    echo=SQL_ECHO,
+    future=True,
+    pool_size=int(os.getenv("DB_POOL_SIZE", "5")),
+    max_overflow=int(os.getenv("DB_MAX_OVERFLOW", "5")),
+    pool_timeout=float(os.getenv("DB_POOL_TIMEOUT", "10")),
+    pool_recycle=int(os.getenv("DB_POOL_RECYCLE", "1800")),
+)
 AsyncSessionLocal = sessionmaker(
     bind=engine,
     class_=AsyncSession,
@@ -18,6 +27,8 @@ AsyncSessionLocal = sessionmaker(
 )
 async def init_db():
     async with engine.begin() as conn:
+        # only creates missing tables; column and index changes to existing ones ship as Alembic migrations,
+        # applied once per deploy (alembic upgrade head) rather than by every worker on start
         await conn.run_sync(SQLModel.metadata.create_all)
 async def get_session() -> AsyncGenerator[AsyncSession, None]:
     async with AsyncSessionLocal() as session:
@@ -0,0 +1,31 @@
+import hashlib
+import os
+import re
+from typing import Optional
+
+SIMHASH_BITS = 64
+SIMHASH_MAX_DISTANCE = int(os.getenv("SIMHASH_MAX_DISTANCE", "3"))
+DEDUP_LOOKBACK = int(os.getenv("DEDUP_LOOKBACK", "10"))  # most recent analyses per user to compare against
+SHINGLE_SIZE = 3
+_TOKEN = re.compile(r"[a-z][a-z+#.]*")  # digits are dropped so edited dates and phone numbers don't move the hash
+
+def simhash(text: str) -> int:
+    """64-bit SimHash over word shingles; near-identical texts differ in only a few bits."""
+    tokens = _TOKEN.findall(text.lower())
+    shingles = [" ".join(tokens[i:i + SHINGLE_SIZE]) for i in range(max(1, len(tokens) - SHINGLE_SIZE + 1))]
+    weights = [0] * SIMHASH_BITS
+    for shingle in shingles:
+        h = int.from_bytes(hashlib.blake2b(shingle.encode(), digest_size=8).digest(), "big")
+        for bit in range(SIMHASH_BITS):
+            weights[bit] += 1 if h >> bit & 1 else -1
+    return sum(1 << bit for bit in range(SIMHASH_BITS) if weights[bit] > 0)
+
+def to_signed(value: int) -> int:
+    """Fit an unsigned 64-bit fingerprint into a Postgres BIGINT."""
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+def distance(a: int, b: int) -> int:
+    return bin((a ^ b) & ((1 << 64) - 1)).count("1")
+
+def is_near_duplicate(a: int, b: Optional[int]) -> bool:
+    return b is not None and distance(a, b) <= SIMHASH_MAX_DISTANCE
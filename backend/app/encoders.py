@@ -0,0 +1,198 @@
+import argparse
+import fcntl
+import json
+import logging
+import os
+import shutil
+from pathlib import Path
+from typing import List
+import numpy as np
+
+logger = logging.getLogger(__name__)
+ROOT = Path(__file__).resolve().parent.parent
+MODEL_NAME = "sentence-transformers/paraphrase-MiniLM-L3-v2"
+MAX_SEQ_LENGTH = 128  # matches the sentence-transformers config for this model
+EMBEDDING_DIM = 384
+ONNX_DIR = ROOT / "onnx_model"
+ENCODER_BACKEND = os.getenv("ENCODER_BACKEND", "torch")  # torch | onnx | onnx-int8
+BACKENDS = ("torch", "onnx", "onnx-int8")
+EXPORT_INPUTS = ("input_ids", "attention_mask", "token_type_ids")
+
+def quantize_binary(embeddings: np.ndarray) -> np.ndarray:
+    """Same packing as sentence_transformers quantize_embeddings(precision="binary"), without importing torch."""
+    packed = np.packbits(embeddings > 0, axis=1)
+    return (packed.astype(np.int16) - 128).astype(np.int8)
+
+class TorchEncoder:
+    """SentenceTransformer running on PyTorch."""
+    name = "torch"
+
+    def __init__(self):
+        from sentence_transformers import SentenceTransformer
+        self.model = SentenceTransformer(MODEL_NAME)
+
+    def encode(self, texts: List[str], normalize_embeddings: bool = True, batch_size: int = 32) -> np.ndarray:
+        import torch
+        with torch.no_grad():
+            return self.model.encode(texts, normalize_embeddings=normalize_embeddings, batch_size=batch_size)
+
+class OnnxEncoder:
+    """The same transformer exported to ONNX and run by onnxruntime, with mean pooling done in numpy."""
+
+    def __init__(self, quantized: bool = False):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+        self.name = "onnx-int8" if quantized else "onnx"
+        path = export_onnx(quantized=quantized)
+        self.tokenizer = AutoTokenizer.from_pretrained(str(ONNX_DIR))
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.intra_op_num_threads = int(os.getenv("ONNX_THREADS", "0"))
+        self.session = ort.InferenceSession(str(path), options, providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+
+    def encode(self, texts: List[str], normalize_embeddings: bool = True, batch_size: int = 32) -> np.ndarray:
+        out = []
+        for start in range(0, len(texts), batch_size):
+            batch = self.tokenizer(
+                texts[start:start + batch_size],
+                padding=True,
+                truncation=True,
+                max_length=MAX_SEQ_LENGTH,
+                return_tensors="np",
+            )
+            feeds = {k: v.astype(np.int64) for k, v in batch.items() if k in self.input_names}
+            hidden = self.session.run(None, feeds)[0]
+            mask = batch["attention_mask"][..., None].astype(np.float32)
+            pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            out.append(pooled)
+        emb = np.vstack(out) if out else np.zeros((0, EMBEDDING_DIM), dtype=np.float32)
+        if normalize_embeddings:
+            emb = emb / np.clip(np.linalg.norm(emb, axis=1, keepdims=True), 1e-12, None)
+        return emb.astype(np.float32)
+
+def _export_manifest() -> dict:
+    try:
+        manifest = json.loads((ONNX_DIR / "export.json").read_text())
+    except (OSError, ValueError):
+        return {}
+    # Exports made before the input order was pinned fed attention_mask into token_type_ids
+    return manifest if manifest.get("input_order") == list(EXPORT_INPUTS) else {}
+
+def _export_ready(quantized: bool) -> bool:
+    manifest = _export_manifest()
+    return bool(manifest) and (not quantized or manifest.get("int8", False))
+
+def _write_export(tmp: Path, quantized: bool) -> dict:
+    """Write whatever the current export lacks (model, tokenizer, int8 variant) into `tmp`; returns the new manifest."""
+    manifest = _export_manifest()
+    source = ONNX_DIR / "model.onnx"
+    if not manifest:
+        import torch
+        from transformers import AutoModel, AutoTokenizer
+        logger.info(f"Exporting {MODEL_NAME} to ONNX at {ONNX_DIR}")
+        tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME)
+        model = AutoModel.from_pretrained(MODEL_NAME).eval()
+        sample = tokenizer(["export sample"], return_tensors="pt")
+        # Positional args must follow BertModel.forward's order, not the tokenizer's key order
+        names = [n for n in EXPORT_INPUTS if n in sample]
+        axes = {n: {0: "batch", 1: "sequence"} for n in names}
+        axes["last_hidden_state"] = {0: "batch", 1: "sequence"}
+        source = tmp / "model.onnx"
+        with torch.no_grad():
+            torch.onnx.export(
+                model,
+                tuple(sample[n] for n in names),
+                str(source),
+                input_names=names,
+                output_names=["last_hidden_state"],
+                dynamic_axes=axes,
+                opset_version=14,
+            )
+        tokenizer.save_pretrained(str(tmp))
+        manifest = {"model": MODEL_NAME, "input_order": list(EXPORT_INPUTS)}
+    if quantized and not manifest.get("int8"):
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        logger.info(f"Quantizing ONNX model to int8 at {ONNX_DIR / 'model.int8.onnx'}")
+        quantize_dynamic(str(source), str(tmp / "model.int8.onnx"), weight_type=QuantType.QInt8)
+        manifest["int8"] = True
+    return manifest
+
+def export_onnx(quantized: bool = False) -> Path:
+    """Export the transformer to ONNX_DIR (and its int8 dynamic-quantized variant) once; needs torch only on first run.
+
+    Safe with several workers starting together: the first to take the lock writes into a private temp dir and
+    publishes each file with os.replace, manifest last; the rest wait and find a current export.
+    """
+    fp32_path = ONNX_DIR / "model.onnx"
+    int8_path = ONNX_DIR / "model.int8.onnx"
+    if not _export_ready(quantized):
+        ONNX_DIR.mkdir(parents=True, exist_ok=True)
+        with open(ONNX_DIR / ".export.lock", "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                if not _export_ready(quantized):
+                    tmp = ONNX_DIR / f".export.{os.getpid()}.tmp"
+                    shutil.rmtree(tmp, ignore_errors=True)
+                    tmp.mkdir()
+                    try:
+                        manifest = _write_export(tmp, quantized)
+                        for path in sorted(tmp.iterdir()):
+                            os.replace(path, ONNX_DIR / path.name)
+                        if not manifest.get("int8"):
+                            int8_path.unlink(missing_ok=True)  # quantized from an older export
+                        (tmp / "export.json").write_text(json.dumps(manifest))
+                        os.replace(tmp / "export.json", ONNX_DIR / "export.json")
+                    finally:
+                        shutil.rmtree(tmp, ignore_errors=True)
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+    return int8_path if quantized else fp32_path
+
+def load_encoder(backend: str = None):
+    """Build the sentence encoder selected by ENCODER_BACKEND; every backend exposes encode()."""
+    backend = backend or ENCODER_BACKEND
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown ENCODER_BACKEND {backend!r}, expected one of {BACKENDS}")
+    logger.info(f"Loading {backend} sentence encoder")
+    if backend == "torch":
+        return TorchEncoder()
+    return OnnxEncoder(quantized=backend == "onnx-int8")
+
+def check_equivalence(backend: str, queries: List[str], docs: List[str], top_k: int = 5, tolerance: float = 0.02, min_overlap: float = 0.8) -> dict:
+    """Compare a backend against the PyTorch reference: embedding cosine and top-k ranking agreement."""
+    reference, candidate = load_encoder("torch"), load_encoder(backend)
+    ref_docs, cand_docs = reference.encode(docs), candidate.encode(docs)
+    ref_q, cand_q = reference.encode(queries), candidate.encode(queries)
+    min_cosine = float(np.min(np.sum(ref_docs * cand_docs, axis=1)))
+    overlaps = []
+    for rq, cq in zip(ref_q, cand_q):
+        ref_top = set(np.argsort(-ref_docs @ rq)[:top_k])
+        cand_top = set(np.argsort(-cand_docs @ cq)[:top_k])
+        overlaps.append(len(ref_top & cand_top) / top_k)
+    report = {
+        "backend": backend,
+        "min_cosine": round(min_cosine, 4),
+        "mean_topk_overlap": round(float(np.mean(overlaps)), 4) if overlaps else 1.0,
+        "ok": min_cosine >= 1 - tolerance and all(o >= min_overlap for o in overlaps),
+    }
+    logger.info(f"Equivalence vs torch: {report}")
+    return report
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Export ONNX encoders or check them against PyTorch")
+    parser.add_argument("command", choices=["export", "check"])
+    parser.add_argument("--backend", default="onnx-int8", choices=BACKENDS[1:])
+    parser.add_argument("--tolerance", type=float, default=0.02)
+    parser.add_argument("--min-overlap", type=float, default=0.8)
+    args = parser.parse_args()
+    if args.command == "export":
+        export_onnx(quantized=args.backend == "onnx-int8")
+    else:
+        jobs = json.loads((ROOT / "jobs.json").read_text())
+        docs = [j.get("description", "") for j in jobs]
+        queries = [" ".join(j.get("requiredSkills", [])) or j.get("title", "") for j in jobs]
+        report = check_equivalence(args.backend, queries, docs, tolerance=args.tolerance, min_overlap=args.min_overlap)
+        print(json.dumps(report, indent=2))
+        raise SystemExit(0 if report["ok"] else 1)
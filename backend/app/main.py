@@ -6,12 +6,14 @@ from slowapi.errors import RateLimitExceeded
 from slowapi.util import get_remote_address
 from slowapi.middleware import SlowAPIMiddleware
 from starlette.responses import JSONResponse
+from starlette.middleware.gzip import GZipMiddleware
+import asyncio
 import logging
 import os
-import gc
 import psutil
 from app.routes import analyze_router, auth_router
 from app.db import init_db
+from app import admission, catalog, memory, metrics, utils
 
 logging.basicConfig(
     level=logging.INFO,
@@ -20,22 +22,42 @@ logging.basicConfig(
 )
 logger = logging.getLogger("career-assist-api")
 limiter = Limiter(key_func=get_remote_address)
+WARMUP_RETRY_SECONDS = float(os.getenv("WARMUP_RETRY_SECONDS", "2"))
+WARMUP_RETRY_MAX_SECONDS = float(os.getenv("WARMUP_RETRY_MAX_SECONDS", "60"))
+
+async def warm_up():
+    """Create tables, seed, load the model and map the catalog; retried with capped exponential backoff so a worker never stays unready."""
+    delay = WARMUP_RETRY_SECONDS
+    while True:
+        try:
+            await init_db()
+            await catalog.seed_if_empty()
+            if not utils.is_ready():
+                await asyncio.to_thread(utils.warm_up)
+            await catalog.refresh()
+            return
+        except Exception as e:
+            logger.error(f"Warm-up failed, retrying in {delay:g}s: {str(e)}")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, WARMUP_RETRY_MAX_SECONDS)
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    await init_db()
-    workers = int(os.getenv("UVICORN_WORKERS", "1"))
-    if workers != 1:
-        logger.warning(f"Multiple workers detected ({workers}). Forcing single worker to reduce memory.")
-        os.environ["UVICORN_WORKERS"] = "1"
-    logger.info("✅ Database initialized and tables created")
-    logger.info(f"Uvicorn workers: {os.getenv('UVICORN_WORKERS', '1')}")
+    # The database is only touched from warm_up, so an outage at boot delays readiness instead of killing the worker
+    logger.info(f"Worker pid={os.getpid()}, configured workers: {os.getenv('UVICORN_WORKERS', '1')}")
     process = psutil.Process(os.getpid())
     mem_info = process.memory_info()
     logger.info(f"Startup memory: RSS={mem_info.rss / 1024**2:.2f} MB")
+    warmup = asyncio.create_task(warm_up())
+    watcher = asyncio.create_task(memory.watch_memory())
+    catalog_watcher = asyncio.create_task(catalog.watch_catalog())
+    cpu_sampler = asyncio.create_task(admission.sample_cpu())
     yield
     logger.info("🛑 Application shutting down...")
-    gc.collect()
+    cpu_sampler.cancel()
+    catalog_watcher.cancel()
+    watcher.cancel()
+    warmup.cancel()
     mem_info = process.memory_info()
     logger.info(f"Shutdown memory: RSS={mem_info.rss / 1024**2:.2f} MB")
 
@@ -53,6 +75,12 @@ app.add_exception_handler(
     )
 )
 app.add_middleware(SlowAPIMiddleware)
+compress_min_size = int(os.getenv("COMPRESS_MIN_SIZE", "1024"))
+try:
+    from brotli_asgi import BrotliMiddleware
+    app.add_middleware(BrotliMiddleware, quality=4, minimum_size=compress_min_size, gzip_fallback=True)
+except ImportError:
+    app.add_middleware(GZipMiddleware, minimum_size=compress_min_size)
 allowed_origins = os.getenv("ALLOWED_ORIGINS", "http://localhost:3000").split(",")
 app.add_middleware(
     CORSMiddleware,
@@ -69,12 +97,31 @@ app.include_router(auth_router)
 async def health_check(request: Request):
     return {"status": "ok"}
 
+@app.get("/health/live")
+async def liveness():
+    return {"status": "alive"}
+
+@app.get("/health/ready")
+async def readiness():
+    snapshot = catalog.peek()
+    if not utils.is_ready() or snapshot is None:
+        return JSONResponse(status_code=503, content={"status": "warming_up"})
+    return {"status": "ready", "model_loaded": utils.model_loaded(), "catalog_version": snapshot.version}
+
 @app.get("/memory-usage")
 async def memory_usage():
     process = psutil.Process(os.getpid())
-    mem_info = process.memory_info()
-    logger.info(f"Memory usage: RSS={mem_info.rss / 1024**2:.2f} MB, VMS={mem_info.vms / 1024**2:.2f} MB")
+    mem_info = process.memory_full_info()
+    logger.info(f"Memory usage: RSS={mem_info.rss / 1024**2:.2f} MB, USS={mem_info.uss / 1024**2:.2f} MB, VMS={mem_info.vms / 1024**2:.2f} MB")
     return {
+        "pid": process.pid,
         "ram_used_mb": round(mem_info.rss / 1024**2, 2),
-        "virtual_memory_mb": round(mem_info.vms / 1024**2, 2)
-    }
\ No newline at end of file
+        "unique_mb": round(mem_info.uss / 1024**2, 2),
+        "virtual_memory_mb": round(mem_info.vms / 1024**2, 2),
+        "budget": memory.stats(),
+        "admission": admission.stats(),
+    }
+
+@app.get("/metrics")
+async def app_metrics():
+    return {"pid": os.getpid(), **metrics.snapshot()}
\ No newline at end of file
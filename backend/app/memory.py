@@ -0,0 +1,132 @@
+import asyncio
+import gc
+import logging
+import os
+import time
+import psutil
+
+logger = logging.getLogger(__name__)
+
+# torch alone is ~430 MB RSS and a MiniLM worker ~630 MB after a few batches, so budget well above that
+MEMORY_BUDGET_MB = float(os.getenv("MEMORY_BUDGET_MB", "1024"))
+# off by default: over budget only logs a warning, since unloading makes the next request pay a cold load
+MEMORY_UNLOAD_OVER_BUDGET = os.getenv("MEMORY_UNLOAD_OVER_BUDGET", "false").lower() in ("1", "true", "yes")
+MEMORY_HIGH_WATER = float(os.getenv("MEMORY_HIGH_WATER", "0.85"))
+MODEL_IDLE_SECONDS = float(os.getenv("MODEL_IDLE_SECONDS", "0"))  # 0 keeps the model resident
+MEMORY_CHECK_INTERVAL = float(os.getenv("MEMORY_CHECK_INTERVAL", "30"))
+
+_last_used = time.monotonic()
+_collections = 0
+_unloads = 0
+
+def mark_used() -> None:
+    """Record that the model was just used so the idle timer restarts."""
+    global _last_used
+    _last_used = time.monotonic()
+
+def rss_mb() -> float:
+    return psutil.Process(os.getpid()).memory_info().rss / 1024**2
+
+def high_water_mb() -> float:
+    return MEMORY_BUDGET_MB * MEMORY_HIGH_WATER
+
+def idle_seconds() -> float:
+    return time.monotonic() - _last_used
+
+def stats() -> dict:
+    return {
+        "rss_mb": round(rss_mb(), 2),
+        "budget_mb": MEMORY_BUDGET_MB,
+        "high_water_mb": round(high_water_mb(), 2),
+        "model_idle_s": round(idle_seconds(), 1),
+        "collections": _collections,
+        "unloads": _unloads,
+    }
+
+async def _collect() -> None:
+    global _collections
+    before = rss_mb()
+    await asyncio.to_thread(gc.collect)
+    _collections += 1
+    logger.info(f"High-water collection: RSS {before:.2f} MB -> {rss_mb():.2f} MB")
+
+def _unload(reason: str) -> bool:
+    global _unloads
+    from app import utils
+    if not utils.unload_model():
+        return False
+    _unloads += 1
+    logger.info(f"Unloaded model ({reason})")
+    return True
+
+async def check_once() -> None:
+    """Apply the budget policy once: unload when idle, collect above the high-water mark, warn (or unload, if enabled) over budget."""
+    if MODEL_IDLE_SECONDS > 0 and idle_seconds() >= MODEL_IDLE_SECONDS:
+        if _unload(f"idle for {idle_seconds():.0f}s"):
+            await _collect()
+            return
+    if rss_mb() < high_water_mb():
+        return
+    await _collect()
+    if rss_mb() >= MEMORY_BUDGET_MB:
+        logger.warning(f"RSS {rss_mb():.2f} MB still over budget {MEMORY_BUDGET_MB:.0f} MB after collection")
+        if MEMORY_UNLOAD_OVER_BUDGET and _unload("over memory budget"):
+            await _collect()
+
+async def watch_memory() -> None:
+    """Background loop started from the app lifespan; keeps GC off the request path."""
+    logger.info(
+        f"Memory budget {MEMORY_BUDGET_MB:.0f} MB, high-water {high_water_mb():.0f} MB, "
+        f"model idle unload {'after %.0fs' % MODEL_IDLE_SECONDS if MODEL_IDLE_SECONDS > 0 else 'disabled'}, "
+        f"over-budget unload {'enabled' if MEMORY_UNLOAD_OVER_BUDGET else 'disabled'}"
+    )
+    while True:
+        await asyncio.sleep(MEMORY_CHECK_INTERVAL)
+        try:
+            await check_once()
+        except Exception as e:
+            logger.error(f"Memory check failed: {str(e)}")
+
+def anonymous_mb(pid: int) -> float:
+    """Heap/stack memory of a process; unlike USS it excludes clean pages of mapped files such as the catalog."""
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                if line.startswith("Anonymous:"):
+                    return round(int(line.split()[1]) / 1024, 2)
+    except OSError:
+        pass
+    return 0.0
+
+def worker_report(master_pid: int) -> dict:
+    """Per-worker memory for a gunicorn/uvicorn master: anonymous memory is what each extra worker really costs.
+
+    USS also counts page-cache pages of the memory-mapped catalog that only one worker happened to touch.
+    """
+    master = psutil.Process(master_pid)
+    workers = []
+    for child in master.children():
+        info = child.memory_full_info()
+        workers.append({
+            "pid": child.pid,
+            "rss_mb": round(info.rss / 1024**2, 2),
+            "uss_mb": round(info.uss / 1024**2, 2),
+            "pss_mb": round(getattr(info, "pss", 0) / 1024**2, 2),
+            "anon_mb": anonymous_mb(child.pid),
+        })
+    master_info = master.memory_full_info()
+    total_uss = sum(w["uss_mb"] for w in workers)
+    return {
+        "master": {"pid": master_pid, "rss_mb": round(master_info.rss / 1024**2, 2), "uss_mb": round(master_info.uss / 1024**2, 2)},
+        "workers": workers,
+        "incremental_per_worker_mb": round(total_uss / len(workers), 2) if workers else 0.0,
+        "anon_per_worker_mb": round(sum(w["anon_mb"] for w in workers) / len(workers), 2) if workers else 0.0,
+        "total_pss_mb": round(sum(w["pss_mb"] for w in workers) + getattr(master_info, "pss", 0) / 1024**2, 2),
+    }
+
+if __name__ == "__main__":
+    import json
+    import sys
+    if len(sys.argv) != 2:
+        raise SystemExit("usage: python -m app.memory <master_pid>")
+    print(json.dumps(worker_report(int(sys.argv[1])), indent=2))
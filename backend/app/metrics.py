@@ -0,0 +1,13 @@
+from collections import Counter
+
+_COUNTERS: Counter = Counter()
+
+def incr(name: str, value: int = 1) -> None:
+    _COUNTERS[name] += value
+
+def snapshot() -> dict:
+    analyses = _COUNTERS["analyses_total"]
+    return {
+        **_COUNTERS,
+        "dedup_reuse_rate": round(_COUNTERS["dedup_reused"] / analyses, 4) if analyses else 0.0,
+    }
@@ -1,39 +1,57 @@
 from typing import Optional, List, Dict, Any
 from sqlmodel import SQLModel, Field, Relationship
-from sqlalchemy import Column
+from sqlalchemy import BigInteger, Column, Index, LargeBinary
 from sqlalchemy.dialects.postgresql import JSONB
 import datetime
 class User(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
-    email: Optional[str] = Field(index=True) 
+    email: Optional[str] = Field(index=True, unique=True)
     name: Optional[str] = None
     created_at: datetime.datetime = Field(default_factory=datetime.datetime.utcnow)
     analyses: List["Analysis"] = Relationship(back_populates="user")
     github_profiles: List["GitHubProfile"] = Relationship(back_populates="user")
 class Analysis(SQLModel, table=True):
+    __table_args__ = (Index("ix_analysis_user_created", "user_id", "created_at"),)
     id: Optional[int] = Field(default=None, primary_key=True)
     user_id: int = Field(foreign_key="user.id")
     created_at: datetime.datetime = Field(default_factory=datetime.datetime.utcnow)
     updated_at: Optional[datetime.datetime] = None
     status: str = "pending"
     task_id: Optional[str] = None
-    resume_text: Optional[str] = None
+    resume_text: Optional[str] = None  # legacy rows only; new rows use resume_blob
+    resume_blob: Optional[bytes] = Field(default=None, sa_column=Column(LargeBinary))  # zlib-compressed resume text
+    resume_embedding: Optional[bytes] = Field(default=None, sa_column=Column(LargeBinary))  # normalized float32 vector
+    embedding_backend: Optional[str] = None  # encoder backend that produced resume_embedding
+    simhash: Optional[int] = Field(default=None, sa_column=Column(BigInteger))  # 64-bit text fingerprint, stored signed
     extracted_skills: Optional[List[str]] = Field(default_factory=list, sa_column=Column(JSONB))
     missing_skills: Optional[List[str]] = Field(default_factory=list, sa_column=Column(JSONB))
     result: Optional[Dict[str, Any]] = Field(default_factory=dict, sa_column=Column(JSONB))
+    top_job_id: Optional[int] = None
+    top_score: Optional[float] = None
     error: Optional[str] = None
     user: User = Relationship(back_populates="analyses")
 class Job(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
+    external_id: Optional[str] = Field(default=None, index=True, unique=True)  # feed id, or a content key
     title: str
     company: str
     description: str
     required_skills: Optional[List[str]] = Field(default_factory=list, sa_column=Column(JSONB))
     salary_range: Optional[str] = None
+    content_hash: Optional[str] = None
+    embedding: Optional[bytes] = Field(default=None, sa_column=Column(LargeBinary))  # normalized float32 vector
+    embedding_backend: Optional[str] = None
+    active: bool = True
+    updated_at: Optional[datetime.datetime] = Field(default_factory=datetime.datetime.utcnow)
 class GitHubProfile(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
     user_id: int = Field(foreign_key="user.id")
     username: str
     repos: Optional[Dict[str, List[str]]] = Field(default_factory=dict, sa_column=Column(JSONB))  # Evidence dict
     last_synced: Optional[datetime.datetime] = Field(default_factory=datetime.datetime.utcnow)
-    user: User = Relationship(back_populates="github_profiles")
\ No newline at end of file
+    user: User = Relationship(back_populates="github_profiles")
+class AdmissionBucket(SQLModel, table=True):
+    __table_args__ = {"prefixes": ["UNLOGGED"]}  # rate-limit state: cheap to lose on a crash, not worth WAL writes
+    user_id: str = Field(primary_key=True)
+    tokens: float
+    updated: datetime.datetime
\ No newline at end of file
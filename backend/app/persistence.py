@@ -0,0 +1,126 @@
+import datetime
+import logging
+import os
+from collections import OrderedDict
+from typing import Any, List, Optional, Tuple
+from sqlalchemy import func, insert, select, tuple_
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from app import dedup, encoders
+from app.models import Analysis, User
+
+logger = logging.getLogger(__name__)
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "10000"))
+_USER_IDS: "OrderedDict[str, int]" = OrderedDict()
+USERS = User.__table__
+ANALYSES = Analysis.__table__
+
+def _remember(email: str, user_id: int) -> None:
+    _USER_IDS[email] = user_id
+    _USER_IDS.move_to_end(email)
+    while len(_USER_IDS) > USER_CACHE_SIZE:
+        _USER_IDS.popitem(last=False)
+
+def forget_user(email: str) -> None:
+    _USER_IDS.pop(email, None)
+
+async def _upsert_user(session: AsyncSession, email: str, name: Optional[str]) -> int:
+    """INSERT ... ON CONFLICT (email) DO UPDATE ... RETURNING id: one round trip whether or not the user exists."""
+    stmt = pg_insert(USERS).values(email=email, name=name, created_at=datetime.datetime.utcnow())
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[USERS.c.email],
+        set_={"name": func.coalesce(stmt.excluded.name, USERS.c.name)},
+    ).returning(USERS.c.id)
+    return (await session.execute(stmt)).scalar_one()
+
+async def get_user_id(session: AsyncSession, email: str, name: Optional[str] = None) -> int:
+    """Resolve email -> user id from the process cache, upserting the user on a miss."""
+    user_id = _USER_IDS.get(email)
+    if user_id is not None:
+        _USER_IDS.move_to_end(email)
+        return user_id
+    user_id = await _upsert_user(session, email, name)
+    await session.commit()
+    _remember(email, user_id)
+    return user_id
+
+async def save_analysis(session: AsyncSession, email: str, name: Optional[str] = None, **fields: Any) -> int:
+    """Upsert the user (skipped when cached) and insert the analysis in one transaction; returns the analysis id."""
+    values = {"created_at": datetime.datetime.utcnow(), "status": "completed", **fields}
+    for attempt in range(2):
+        user_id = _USER_IDS.get(email)
+        try:
+            if user_id is None:
+                user_id = await _upsert_user(session, email, name)
+            stmt = insert(ANALYSES).values(user_id=user_id, **values).returning(ANALYSES.c.id)
+            analysis_id = (await session.execute(stmt)).scalar_one()
+            await session.commit()
+        except IntegrityError:
+            # A cached id can go stale if the user row was removed; drop it and upsert once more
+            await session.rollback()
+            forget_user(email)
+            if attempt:
+                raise
+            logger.warning(f"Stale cached user id for {email}, retrying with upsert")
+            continue
+        _remember(email, user_id)
+        return analysis_id
+
+async def find_near_duplicate(session: AsyncSession, user_id: int, fingerprint: int) -> Optional[Any]:
+    """Closest of the user's recent analyses within SIMHASH_MAX_DISTANCE, read off the (user_id, created_at) index."""
+    stmt = (
+        select(
+            ANALYSES.c.id,
+            ANALYSES.c.simhash,
+            ANALYSES.c.resume_embedding,
+            ANALYSES.c.result["evidenceBySkill"].label("evidence"),
+        )
+        .where(
+            ANALYSES.c.user_id == user_id,
+            ANALYSES.c.simhash.is_not(None),
+            ANALYSES.c.resume_embedding.is_not(None),
+            ANALYSES.c.embedding_backend == encoders.ENCODER_BACKEND,
+        )
+        .order_by(ANALYSES.c.created_at.desc())
+        .limit(dedup.DEDUP_LOOKBACK)
+    )
+    rows = [r for r in (await session.execute(stmt)).all() if dedup.is_near_duplicate(fingerprint, r.simhash)]
+    # end the read transaction now rather than holding it (and its connection) open through encoding and streaming
+    await session.commit()
+    return min(rows, key=lambda r: dedup.distance(fingerprint, r.simhash), default=None)
+
+async def list_history(
+    session: AsyncSession,
+    user_id: int,
+    limit: int,
+    before: Optional[Tuple[datetime.datetime, int]] = None,
+) -> List[Any]:
+    """Keyset page over (user_id, created_at, id), newest first; only the light summary columns are read."""
+    stmt = (
+        select(
+            ANALYSES.c.id,
+            ANALYSES.c.created_at,
+            ANALYSES.c.status,
+            ANALYSES.c.extracted_skills,
+            ANALYSES.c.missing_skills,
+            ANALYSES.c.top_job_id,
+            ANALYSES.c.top_score,
+        )
+        .where(ANALYSES.c.user_id == user_id)
+        .order_by(ANALYSES.c.created_at.desc(), ANALYSES.c.id.desc())
+        .limit(limit)
+    )
+    if before is not None:
+        stmt = stmt.where(tuple_(ANALYSES.c.created_at, ANALYSES.c.id) < tuple_(*before))
+    return (await session.execute(stmt)).all()
+
+async def get_analysis(session: AsyncSession, user_id: int, analysis_id: int) -> Optional[Any]:
+    stmt = select(
+        ANALYSES.c.id,
+        ANALYSES.c.created_at,
+        ANALYSES.c.result,
+        ANALYSES.c.resume_blob,
+        ANALYSES.c.resume_text,
+    ).where(ANALYSES.c.id == analysis_id, ANALYSES.c.user_id == user_id)
+    return (await session.execute(stmt)).first()
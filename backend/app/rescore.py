@@ -0,0 +1,97 @@
+import asyncio
+import datetime
+import logging
+import os
+import numpy as np
+from sqlalchemy import bindparam, func, select, update
+from app import catalog, encoders, storage, utils
+from app.db import AsyncSessionLocal, init_db
+from app.models import Analysis
+
+logger = logging.getLogger(__name__)
+RESCORE_BATCH_SIZE = int(os.getenv("RESCORE_BATCH_SIZE", "2000"))
+ANALYSES = Analysis.__table__
+
+def rescore_rows(snapshot: catalog.CatalogSnapshot, rows, top_k: int = 5):
+    """Search one batch of stored resume vectors as a single matrix and rebuild each row's match-derived fields."""
+    vectors = np.vstack([np.frombuffer(r.resume_embedding, dtype=np.float32) for r in rows])
+    scores, idxs = snapshot.search(encoders.quantize_binary(vectors), top_k)
+    now = datetime.datetime.utcnow()
+    updates = []
+    for i, r in enumerate(rows):
+        matches = utils.score_matches(snapshot, scores[i], idxs[i], set(r.extracted_skills or []))
+        missing = utils.collect_missing(matches)
+        top = matches[0] if matches else None
+        updates.append({
+            "_id": r.id,
+            "_result": {
+                **r.result,
+                "missingSkills": missing,
+                "matchedJobs": [storage.compact_match(m) for m in matches],
+                "learningPlan": utils.prioritize_skills(missing, matches),
+            },
+            "_missing": missing,
+            "_top_job_id": top["job_id"] if top else None,
+            "_top_score": top["score"] if top else None,
+            "_now": now,
+        })
+    return updates
+
+async def rescore_all(batch_size: int = RESCORE_BATCH_SIZE, top_k: int = 5) -> int:
+    """Re-match every stored analysis against the current catalog; no PDF parsing and no encoder calls.
+
+    Postings must already carry embeddings for the current backend (`python -m app.catalog embed`), and only
+    analyses whose resume vector came from that same backend are re-scored.
+    """
+    backend = encoders.ENCODER_BACKEND
+    pending = await catalog.pending_embeddings()
+    if pending:
+        raise RuntimeError(f"{pending} active postings have no {backend} embedding; run `python -m app.catalog embed` first")
+    await catalog.refresh(encode_missing=False)
+    snapshot = catalog.current()
+    store = (
+        update(ANALYSES)
+        .where(ANALYSES.c.id == bindparam("_id"))
+        .values(
+            result=bindparam("_result"),
+            missing_skills=bindparam("_missing"),
+            top_job_id=bindparam("_top_job_id"),
+            top_score=bindparam("_top_score"),
+            updated_at=bindparam("_now"),
+        )
+    )
+    embedded = ANALYSES.c.resume_embedding.is_not(None)
+    last_id, total = 0, 0
+    async with AsyncSessionLocal() as session:
+        other = select(func.count()).select_from(ANALYSES).where(embedded, ANALYSES.c.embedding_backend.is_distinct_from(backend))
+        skipped = (await session.execute(other)).scalar_one()
+        if skipped:
+            logger.warning(f"Skipping {skipped} analyses whose resume vectors were not produced by the {backend} backend")
+        while True:
+            stmt = (
+                select(ANALYSES.c.id, ANALYSES.c.resume_embedding, ANALYSES.c.extracted_skills, ANALYSES.c.result)
+                .where(ANALYSES.c.id > last_id, embedded, ANALYSES.c.embedding_backend == backend)
+                .order_by(ANALYSES.c.id)
+                .limit(batch_size)
+            )
+            rows = (await session.execute(stmt)).all()
+            if not rows:
+                break
+            last_id = rows[-1].id
+            rows = [r for r in rows if (r.result or {}).get("layout") == storage.LAYOUT_VERSION]
+            if rows:
+                updates = await asyncio.to_thread(rescore_rows, snapshot, rows, top_k)
+                await session.execute(store, updates)
+                await session.commit()
+                total += len(updates)
+            logger.info(f"Re-scored {total} analyses (through id {last_id})")
+    logger.info(f"Re-scoring against catalog {snapshot.version} complete: {total} analyses updated")
+    return total
+
+async def _main() -> None:
+    await init_db()
+    await rescore_all()
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_main())
@@ -1,119 +1,180 @@
 import os
+import base64
 import tempfile
 import logging
 import datetime
-from typing import Optional, Dict, List
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+import orjson
 import requests
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
-from fastapi import (APIRouter,UploadFile,File,HTTPException,Depends)
+from fastapi import (APIRouter,UploadFile,File,HTTPException,Depends,Query)
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from pydantic import BaseModel
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlmodel import select
-from app.utils import (extract_text_from_pdf,extract_skills,match_jobs,generate_learning_plan,generate_evidence,JOBS)
+from app.utils import (extract_text_from_pdf,extract_skills,encode_sentences,pool,match_jobs,collect_missing,generate_learning_plan,generate_evidence,JD_SNIPPET_LIMIT)
 from app.auth import get_current_user
 from app.db import get_session
-from app.models import Analysis, User, GitHubProfile
-import gc
-import torch
-from memory_profiler import profile
+from app.models import GitHubProfile
+from app.persistence import get_user_id, save_analysis, list_history, get_analysis, find_near_duplicate
+from app import admission, catalog, dedup, metrics, storage
 
-router = APIRouter(prefix="/api", tags=["resume"])
+router = APIRouter(prefix="/api", tags=["resume"], default_response_class=ORJSONResponse)
 logger = logging.getLogger(__name__)
 
 class GitHubToken(BaseModel):
     token: str
 
-async def get_or_create_user(
-    session: AsyncSession,
-    email: str,
-    name: Optional[str] = None,
-    login: Optional[str] = None
-) -> User:
-    stmt = select(User).where(User.email == email)
-    result = await session.execute(stmt)
-    user = result.scalar_one_or_none()
-    if not user:
-        user = User(email=email, name=name)
-        session.add(user)
-        await session.commit()
-        await session.refresh(user)
-    return user
+def _project(payload: Dict, fields: Optional[str], exclude: Optional[str]) -> ORJSONResponse:
+    """Keep only `fields` / drop `exclude` (comma-separated top-level keys) and serialize with orjson.
+
+    Returning the response directly skips FastAPI's jsonable_encoder pass over the whole result.
+    """
+    if fields:
+        keep = {f.strip() for f in fields.split(",") if f.strip()} | {"analysis_id"}
+        payload = {k: v for k, v in payload.items() if k in keep}
+    if exclude:
+        drop = {f.strip() for f in exclude.split(",") if f.strip()} - {"analysis_id"}
+        payload = {k: v for k, v in payload.items() if k not in drop}
+    return ORJSONResponse(payload)
+
+async def _read_resume(file: UploadFile) -> str:
+    """Validate the upload and extract its text off the event loop."""
+    if not file.filename.lower().endswith(".pdf"):
+        raise HTTPException(status_code=400, detail="Please upload a valid PDF file")
+
+    data = await file.read()
+    if len(data) > 5 * 1024 * 1024:
+        raise HTTPException(status_code=400, detail="File size must be less than 5MB")
+    if b"%PDF-" not in data[:8]:
+        raise HTTPException(status_code=400, detail="Invalid PDF header")
+    temp_path = None
+    try:
+        with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as temp_file:
+            temp_file.write(data)
+            temp_path = temp_file.name
+        return await run_in_threadpool(extract_text_from_pdf, temp_path)
+    finally:
+        if temp_path and os.path.exists(temp_path):
+            os.unlink(temp_path)
+            logger.info(f"Deleted temporary file {temp_path}")
+
+async def _analysis_stages(text: str, current_user: dict, session: AsyncSession) -> AsyncIterator[Tuple[str, Dict]]:
+    """Run the pipeline, yielding (event, payload) as each stage completes; shared by /analyze and /analyze/stream."""
+    extracted_skills = await run_in_threadpool(extract_skills, text)
+    yield "skills", {"resume_chars": len(text), "extractedSkills": extracted_skills}
+
+    fingerprint = await run_in_threadpool(dedup.simhash, text)
+    user_id = await get_user_id(session, current_user["email"], current_user.get("name"))
+    prior = await find_near_duplicate(session, user_id, fingerprint)
+    metrics.incr("analyses_total")
+    sentences, sentence_vectors, known_similarity = None, None, None
+    if prior is not None:
+        # Near-identical re-upload: reuse the stored vector and the per-skill sentence similarities
+        # and skip the encoder; skills, keyword overlap and evidence snippets still come from the new text
+        metrics.incr("dedup_reused")
+        logger.info(f"Reusing embedding of analysis {prior.id} (simhash distance {dedup.distance(fingerprint, prior.simhash)})")
+        embedding = storage.from_embedding(prior.resume_embedding)
+        known_similarity = {
+            skill: ev["similarity"] for skill, ev in (prior.evidence or {}).items() if ev.get("similarity") is not None
+        }
+        if any(skill not in known_similarity for skill in extracted_skills):
+            # A skill the prior analysis has no similarity for: score evidence from a fresh sentence batch
+            sentences, sentence_vectors = await run_in_threadpool(encode_sentences, text)
+    else:
+        # One batch over all sentences: pooled for matching, per-sentence vectors for evidence
+        sentences, sentence_vectors = await run_in_threadpool(encode_sentences, text)
+        embedding = pool(sentence_vectors)
+    matched_jobs = await run_in_threadpool(match_jobs, text, 5, embedding, extracted_skills)
+    missing = collect_missing(matched_jobs)
+    yield "matches", {"missingSkills": missing, "matchedJobs": matched_jobs}
+
+    evidence_by_skill = await run_in_threadpool(
+        generate_evidence, text, extracted_skills, sentences, sentence_vectors, known_similarity
+    )
+    yield "evidence", {"evidenceBySkill": evidence_by_skill}
 
-@profile
-@router.post("/analyze")
+    learning_plan = await run_in_threadpool(generate_learning_plan, missing, matched_jobs)
+    yield "learning_plan", {"learningPlan": learning_plan}
+
+    result = {
+        "ok": True,
+        "resume_chars": len(text),
+        "raw_text": text,
+        "extractedSkills": extracted_skills,
+        "missingSkills": missing,
+        "matchedJobs": matched_jobs,
+        "evidenceBySkill": evidence_by_skill,
+        "learningPlan": learning_plan,
+    }
+    analysis_id = await save_analysis(
+        session,
+        current_user["email"],
+        current_user.get("name"),
+        **storage.to_columns(text, result, embedding),
+        simhash=dedup.to_signed(fingerprint),
+    )
+    yield "done", {"analysis_id": analysis_id}
+
+def _sse(event: str, data: Dict) -> bytes:
+    return b"event: " + event.encode() + b"\ndata: " + orjson.dumps(data) + b"\n\n"
+
+@router.post("/analyze", dependencies=[Depends(admission.admit("analyze"))])
 async def analyze_resume(
     file: UploadFile = File(...),
+    fields: Optional[str] = None,
+    exclude: Optional[str] = None,
     current_user: dict = Depends(get_current_user),
     session: AsyncSession = Depends(get_session),
 ):
-    temp_path = None
     try:
-        if not file.filename.lower().endswith(".pdf"):
-            raise HTTPException(status_code=400, detail="Please upload a valid PDF file")
+        text = await _read_resume(file)
+        result = {"ok": True, "raw_text": text}
+        async for _, payload in _analysis_stages(text, current_user, session):
+            result.update(payload)
+        return _project(result, fields, exclude)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.exception(f"Analyze error: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Analysis failed: {str(e)}")
 
-        data = await file.read()
-        if len(data) > 5 * 1024 * 1024:
-            raise HTTPException(status_code=400, detail="File size must be less than 5MB")
-        if b"%PDF-" not in data[:8]:
-            raise HTTPException(status_code=400, detail="Invalid PDF header")
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as temp_file:
-            temp_file.write(data)
-            temp_path = temp_file.name
-        text = extract_text_from_pdf(temp_path)
-        extracted_skills = extract_skills(text)
-        matched_jobs = match_jobs(text, top_k=5)
-        missing, seen = [], set()
-        for job in matched_jobs:
-            for skill in job.get("missing_skills", []):
-                if skill not in seen:
-                    missing.append(skill)
-                    seen.add(skill)
-        learning_plan = generate_learning_plan(missing, matched_jobs)
-        evidence_by_skill = generate_evidence(text, extracted_skills)
-        result = {
-            "ok": True,
-            "resume_chars": len(text),
-            "raw_text": text,
-            "extractedSkills": extracted_skills,
-            "missingSkills": missing,
-            "matchedJobs": matched_jobs,
-            "evidenceBySkill": evidence_by_skill,
-            "learningPlan": learning_plan,
-        }
-        user = await get_or_create_user(
-            session,
-            current_user["email"],
-            current_user.get("name"),
-            current_user.get("login"),
-        )
-        analysis = Analysis(
-            user_id=user.id,
-            resume_text=text,
-            extracted_skills=extracted_skills,
-            missing_skills=missing,
-            result=result,
-            status="completed",
-        )
-        session.add(analysis)
-        await session.commit()
-        await session.refresh(analysis)
-        gc.collect()
-        torch.cuda.empty_cache() if torch.cuda.is_available() else None
-        return {**result, "analysis_id": analysis.id}
+@router.post("/analyze/stream", dependencies=[Depends(admission.admit("analyze"))])
+async def analyze_resume_stream(
+    file: UploadFile = File(...),
+    current_user: dict = Depends(get_current_user),
+    session: AsyncSession = Depends(get_session),
+):
+    """Same pipeline as /analyze, sent as Server-Sent Events: skills, matches, evidence, learning_plan, done."""
+    try:
+        text = await _read_resume(file)
     except HTTPException:
         raise
     except Exception as e:
         logger.exception(f"Analyze error: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Analysis failed: {str(e)}")
-    finally:
-        if temp_path and os.path.exists(temp_path):
-            os.unlink(temp_path)
-            logger.info(f"Deleted temporary file {temp_path}")
-        gc.collect()
 
-@profile
-@router.post("/github-integrate")
+    async def events():
+        # Headers are already sent, so failures after this point become an `error` event
+        try:
+            async for event, payload in _analysis_stages(text, current_user, session):
+                yield _sse(event, payload)
+        except HTTPException as e:
+            yield _sse("error", {"status": e.status_code, "detail": e.detail})
+        except Exception as e:
+            logger.exception(f"Analyze stream error: {str(e)}")
+            yield _sse("error", {"status": 500, "detail": f"Analysis failed: {str(e)}"})
+
+    # Content-Encoding is set so the Brotli/GZip middleware passes events through instead of buffering them
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no", "Content-Encoding": "identity"},
+    )
+
+@router.post("/github-integrate", dependencies=[Depends(admission.admit("github"))])
 async def github_integrate(
     github_token: GitHubToken,
     current_user: dict = Depends(get_current_user),
@@ -192,8 +253,8 @@ async def github_integrate(
             if any("test" in f or "spec" in f or "jest" in f for f in file_names):
                 github_evidence.setdefault("Testing", []).append(html_url)
         logger.info(f"GitHub integration completed, found evidence for {len(github_evidence)} skills")
-        user = await get_or_create_user(session, current_user["email"], current_user.get("name"), current_user.get("login"))
-        stmt = select(GitHubProfile).where(GitHubProfile.user_id == user.id)
+        user_id = await get_user_id(session, current_user["email"], current_user.get("name"))
+        stmt = select(GitHubProfile).where(GitHubProfile.user_id == user_id)
         result = await session.execute(stmt)
         existing_profile = result.scalar_one_or_none()
         if existing_profile:
@@ -202,14 +263,13 @@ async def github_integrate(
             session.add(existing_profile)
         else:
             profile = GitHubProfile(
-                user_id=user.id,
+                user_id=user_id,
                 username=current_user.get("login", "unknown"),
                 repos=github_evidence,
                 last_synced=datetime.datetime.utcnow(),
             )
             session.add(profile)
         await session.commit()
-        gc.collect()
         return github_evidence
     except HTTPException:
         raise
@@ -217,42 +277,90 @@ async def github_integrate(
         logger.exception(f"GitHub integration error: {str(e)}")
         raise HTTPException(status_code=500, detail=f"GitHub integration failed: {str(e)}")
 
-@profile
-@router.get("/recommendations")
+@router.get("/recommendations", dependencies=[Depends(admission.admit("recommendations"))])
 async def get_recommendations(
     skills: str = "",
+    fields: Optional[str] = None,
+    exclude: Optional[str] = None,
     current_user: dict = Depends(get_current_user),
-    session: AsyncSession = Depends(get_session),
 ):
     try:
         if not skills.strip():
             raise HTTPException(status_code=400, detail="Skills parameter cannot be empty")
         user_skills = set(skills.split(","))
         text = " ".join(user_skills)[:10000]  # Cap input
-        matched_jobs = match_jobs(text, top_k=5)
-        all_required = set(skill for job in JOBS for skill in job.get("requiredSkills", []))
-        missing_skills = list(all_required - user_skills)
-        learning_plan = generate_learning_plan(missing_skills, matched_jobs)
+        snapshot = catalog.current()
+        matched_jobs = await run_in_threadpool(match_jobs, text, 5)
+        missing_skills = list(snapshot.all_required - user_skills)
+        learning_plan = await run_in_threadpool(generate_learning_plan, missing_skills, matched_jobs)
         evidence_by_skill = {
             skill: {"resume": [], "jd": [], "confidence": 0.5} for skill in user_skills
         }
         for skill in user_skills:
-            jd_snippets = [job["description"][:100] for job in JOBS if skill in job.get("requiredSkills", [])]
+            jd_snippets = [job["description"][:100] for job in snapshot.jobs_with_skill(skill, JD_SNIPPET_LIMIT)]
             evidence_by_skill[skill]["jd"] = jd_snippets or [f"No job requires {skill}"]
 
         logger.info("Successfully generated recommendations")
-        await get_or_create_user(session, current_user["email"], current_user.get("name"), current_user.get("login"))
-        gc.collect()
-        torch.cuda.empty_cache() if torch.cuda.is_available() else None
-        return {
+        return _project({
             "extractedSkills": list(user_skills),
             "missingSkills": missing_skills,
             "matchedJobs": matched_jobs,
             "evidenceBySkill": evidence_by_skill,
             "learningPlan": learning_plan,
-        }
+        }, fields, exclude)
     except HTTPException:
         raise
     except Exception as e:
         logger.exception(f"Recommendations error: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"Failed to get recommendations: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Failed to get recommendations: {str(e)}")
+
+def _encode_cursor(created_at: datetime.datetime, analysis_id: int) -> str:
+    return base64.urlsafe_b64encode(f"{created_at.isoformat()}|{analysis_id}".encode()).decode()
+
+def _decode_cursor(cursor: str):
+    try:
+        created_at, analysis_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.datetime.fromisoformat(created_at), int(analysis_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+@router.get("/history", dependencies=[Depends(admission.admit("history"))])
+async def analysis_history(
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    current_user: dict = Depends(get_current_user),
+    session: AsyncSession = Depends(get_session),
+):
+    try:
+        user_id = await get_user_id(session, current_user["email"], current_user.get("name"))
+        before = _decode_cursor(cursor) if cursor else None
+        rows = await list_history(session, user_id, limit + 1, before)
+        page = rows[:limit]
+        next_cursor = _encode_cursor(page[-1].created_at, page[-1].id) if len(rows) > limit else None
+        return ORJSONResponse({"items": [storage.summary(r) for r in page], "next_cursor": next_cursor})
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.exception(f"History error: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to load history: {str(e)}")
+
+@router.get("/history/{analysis_id}", dependencies=[Depends(admission.admit("history"))])
+async def analysis_detail(
+    analysis_id: int,
+    fields: Optional[str] = None,
+    exclude: Optional[str] = None,
+    current_user: dict = Depends(get_current_user),
+    session: AsyncSession = Depends(get_session),
+):
+    try:
+        user_id = await get_user_id(session, current_user["email"], current_user.get("name"))
+        row = await get_analysis(session, user_id, analysis_id)
+        if row is None:
+            raise HTTPException(status_code=404, detail="Analysis not found")
+        text = storage.unpack_text(row.resume_blob) or row.resume_text
+        return _project({**storage.expand_result(row.result, text), "analysis_id": row.id}, fields, exclude)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.exception(f"Analysis detail error: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to load analysis: {str(e)}")
\ No newline at end of file
@@ -0,0 +1,100 @@
+import logging
+import zlib
+from typing import Any, Dict, Optional
+import numpy as np
+from app import catalog, encoders, utils
+
+logger = logging.getLogger(__name__)
+LAYOUT_VERSION = 2  # rows without "layout" hold the full legacy result
+
+def pack_text(text: str) -> bytes:
+    return zlib.compress(text.encode("utf-8"), 6)
+
+def unpack_text(blob: Optional[bytes]) -> Optional[str]:
+    return zlib.decompress(blob).decode("utf-8") if blob else None
+
+def compact_match(job: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "job_id": job["job_id"],
+        "score": job["score"],
+        "matched_skills": job["matched_skills"],
+        "missing_skills": job["missing_skills"],
+    }
+
+def compact_result(result: Dict[str, Any]) -> Dict[str, Any]:
+    """Strip everything recomputable from the catalog or stored elsewhere: raw text, job copy, resource links, JD snippets."""
+    return {
+        "layout": LAYOUT_VERSION,
+        "ok": result.get("ok", True),
+        "resume_chars": result.get("resume_chars"),
+        "extractedSkills": result.get("extractedSkills", []),
+        "missingSkills": result.get("missingSkills", []),
+        "matchedJobs": [compact_match(job) for job in result.get("matchedJobs", [])],
+        "evidenceBySkill": {
+            skill: {"resume": ev["resume"], "confidence": ev["confidence"], "similarity": ev.get("similarity")}
+            for skill, ev in result.get("evidenceBySkill", {}).items()
+        },
+        "learningPlan": [p["topic"] for p in result.get("learningPlan", [])],
+    }
+
+def _job_card(job_id: int) -> Dict[str, Any]:
+    snapshot = catalog.peek()
+    job = (snapshot.get(job_id) if snapshot else None) or {}
+    return {
+        "title": job.get("title", "Unknown"),
+        "company": job.get("company", "Unknown"),
+        "description": job.get("description", "")[:240],
+        "salaryRange": job.get("salaryRange", "Unknown"),
+    }
+
+def expand_result(stored: Dict[str, Any], resume_text: Optional[str]) -> Dict[str, Any]:
+    """Rebuild the full /api/analyze payload from a compact row by joining catalog data back in."""
+    if not stored or stored.get("layout") != LAYOUT_VERSION:
+        return stored or {}
+    return {
+        "ok": stored["ok"],
+        "resume_chars": stored["resume_chars"],
+        "raw_text": resume_text,
+        "extractedSkills": stored["extractedSkills"],
+        "missingSkills": stored["missingSkills"],
+        "matchedJobs": [{**job, **_job_card(job["job_id"])} for job in stored["matchedJobs"]],
+        "evidenceBySkill": {
+            skill: {
+                "resume": ev["resume"],
+                "jd": utils.jd_snippets(skill) or [f"No job requires {skill}"],
+                "confidence": ev["confidence"],
+                "similarity": ev.get("similarity"),
+            }
+            for skill, ev in stored["evidenceBySkill"].items()
+        },
+        "learningPlan": [utils.learning_plan_entry(i, skill) for i, skill in enumerate(stored["learningPlan"], 1)],
+    }
+
+def from_embedding(blob: Optional[bytes]) -> Optional[np.ndarray]:
+    return np.frombuffer(blob, dtype=np.float32) if blob else None
+
+def to_columns(text: str, result: Dict[str, Any], embedding: Optional[np.ndarray] = None) -> Dict[str, Any]:
+    """Analysis column values for a fresh result: compressed text, compact JSONB and the summary fields."""
+    top = result["matchedJobs"][0] if result.get("matchedJobs") else None
+    return {
+        "resume_blob": pack_text(text),
+        "resume_embedding": embedding.astype(np.float32).tobytes() if embedding is not None else None,
+        "embedding_backend": encoders.ENCODER_BACKEND if embedding is not None else None,
+        "extracted_skills": result.get("extractedSkills", []),
+        "missing_skills": result.get("missingSkills", []),
+        "result": compact_result(result),
+        "top_job_id": top["job_id"] if top else None,
+        "top_score": top["score"] if top else None,
+    }
+
+def summary(row: Any) -> Dict[str, Any]:
+    """History list entry built from the light columns only."""
+    top = _job_card(row.top_job_id) if row.top_job_id is not None else None
+    return {
+        "id": row.id,
+        "created_at": row.created_at.isoformat(),
+        "status": row.status,
+        "extractedSkills": row.extracted_skills or [],
+        "missingSkills": row.missing_skills or [],
+        "topJob": {"title": top["title"], "company": top["company"], "score": row.top_score} if top else None,
+    }
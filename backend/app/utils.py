@@ -2,22 +2,16 @@ import PyPDF2
 import re
 import json
 import numpy as np
-from sentence_transformers import SentenceTransformer
-from sentence_transformers.quantization import quantize_embeddings
-import faiss
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Tuple
 from pathlib import Path
 import logging
 import os
-import gc
-import pickle
-import torch
-from memory_profiler import profile
+import threading
+from app import catalog, encoders, memory
 
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO)
 ROOT = Path(__file__).resolve().parent.parent
-EMBEDDING_CACHE = ROOT / "job_emb_cache.pkl"
 
 def validate_learning_map(data: Dict) -> bool:
     """Validate learning_map.json structure."""
@@ -45,62 +39,68 @@ def validate_learning_map(data: Dict) -> bool:
 
 try:
     skills_path = ROOT / "skills.json"
-    jobs_path = ROOT / "jobs.json"
     learning_map_path = ROOT / "learning_map.json"
-    for path in [skills_path, jobs_path, learning_map_path]:
+    for path in [skills_path, learning_map_path]:
         if not path.exists():
             raise FileNotFoundError(f"{path.name} not found at {path}")
     SKILLS = json.loads(skills_path.read_text())
-    JOBS = json.loads(jobs_path.read_text())
     with open(learning_map_path) as f:
         LEARNING_MAP = json.load(f)
     if not validate_learning_map(LEARNING_MAP):
         raise ValueError("Invalid learning_map.json structure")    
-    logger.info("Successfully loaded and validated skills.json, jobs.json, and learning_map.json")
+    logger.info("Successfully loaded and validated skills.json and learning_map.json")
 except Exception as e:
     logger.error(f"Failed to load JSON files: {str(e)}")
     raise Exception(f"Failed to load required data files: {str(e)}")
 
-# Limit jobs to 200 to reduce memory (adjust based on your jobs.json size)
-JOBS = JOBS[:200]
-JOB_TEXTS = [j.get("description", "") for j in JOBS]
-
 _MODEL = None
-_INDEX = None
-_JOB_EMB = None
-
-def load_or_compute_embeddings():
-    """Load embeddings from cache or compute and save."""
-    global _JOB_EMB
-    if EMBEDDING_CACHE.exists():
-        with open(EMBEDDING_CACHE, "rb") as f:
-            _JOB_EMB = pickle.load(f)
-        logger.info("Loaded job embeddings from cache")
-    else:
-        with torch.no_grad():  # Prevent gradient memory
-            model = SentenceTransformer("sentence-transformers/paraphrase-MiniLM-L3-v2")
-            _JOB_EMB = model.encode(JOB_TEXTS, normalize_embeddings=True)
-            _JOB_EMB = quantize_embeddings(_JOB_EMB, precision="binary")
-        with open(EMBEDDING_CACHE, "wb") as f:
-            pickle.dump(_JOB_EMB, f)
-        logger.info("Computed and cached job embeddings")
-        torch.cuda.empty_cache() if torch.cuda.is_available() else None
-    return _JOB_EMB
+_WARM = False
+_SKILL_VECTORS: Optional[Dict[str, np.ndarray]] = None
+MAX_RESUME_SENTENCES = int(os.getenv("MAX_RESUME_SENTENCES", "256"))  # keeps the whole resume in one encoder batch
+EVIDENCE_SNIPPETS = int(os.getenv("EVIDENCE_SNIPPETS", "3"))
+EVIDENCE_MIN_SIMILARITY = float(os.getenv("EVIDENCE_MIN_SIMILARITY", "0.35"))
+JD_SNIPPET_LIMIT = int(os.getenv("JD_SNIPPET_LIMIT", "5"))
+_LOAD_LOCK = threading.Lock()
 
-def get_model_and_index():
-    global _MODEL, _INDEX, _JOB_EMB
+def get_model():
+    """The sentence encoder for ENCODER_BACKEND, loaded on first use."""
+    global _MODEL
+    memory.mark_used()
     if _MODEL is None:
-        logger.info("Lazy loading SentenceTransformer model")
-        _MODEL = SentenceTransformer("sentence-transformers/paraphrase-MiniLM-L3-v2")
-        _JOB_EMB = load_or_compute_embeddings()
-        _INDEX = faiss.IndexFlatL2(_JOB_EMB.shape[1])
-        _INDEX.add(_JOB_EMB.astype("float32"))
-        logger.info("FAISS index initialized with binary-quantized job embeddings")
-        gc.collect()
-        torch.cuda.empty_cache() if torch.cuda.is_available() else None
-    return _MODEL, _INDEX
+        with _LOAD_LOCK:
+            if _MODEL is None:
+                _MODEL = encoders.load_encoder()
+    return _MODEL
+
+def unload_model() -> bool:
+    """Drop the encoder; the next get_model() reloads it. The catalog index is memory-mapped and stays."""
+    global _MODEL
+    with _LOAD_LOCK:
+        if _MODEL is None:
+            return False
+        _MODEL = None
+    return True
+
+def model_loaded() -> bool:
+    return _MODEL is not None
+
+def warm_up() -> None:
+    """Load the encoder ahead of traffic (run off the event loop)."""
+    global _WARM
+    try:
+        model = get_model()
+        model.encode(["warm up"], normalize_embeddings=True)
+        skill_vectors()
+    except Exception as e:
+        logger.error(f"Model warm-up failed: {str(e)}")
+        raise
+    _WARM = True
+    logger.info("Model warm-up complete")
+
+def is_ready() -> bool:
+    """True once the initial warm-up has finished; stays true if the model is later unloaded."""
+    return _WARM
 
-@profile
 def extract_text_from_pdf(file_path: str) -> str:
     """Extract text from a PDF file using PyPDF2."""
     try:
@@ -115,7 +115,6 @@ def extract_text_from_pdf(file_path: str) -> str:
                 raise ValueError("No readable text found in the PDF")
             extracted_text = "\n".join(txt).strip()[:10000]  # Cap total text
             logger.info(f"Extracted {len(extracted_text)} characters from PDF")
-            gc.collect()
             return extracted_text
     except Exception as e:
         logger.error(f"PDF parse failed: {str(e)}")
@@ -127,9 +126,7 @@ def extract_text_from_pdf(file_path: str) -> str:
                 logger.info(f"Deleted temporary file {file_path}")
             except Exception as e:
                 logger.warning(f"Failed to delete temp file {file_path}: {str(e)}")
-        gc.collect()
 
-@profile
 def extract_skills(text: str) -> List[str]:
     """Extract skills from text using regex, handling synonyms."""
     try:
@@ -144,49 +141,134 @@ def extract_skills(text: str) -> List[str]:
                     break
         skills = sorted(list(found))
         logger.info(f"Extracted skills: {skills}")
-        gc.collect()
         return skills
     except Exception as e:
         logger.error(f"Skill extraction failed: {str(e)}")
         raise ValueError(f"Skill extraction failed: {str(e)}")
 
-@profile
-def match_jobs(resume_text: str, top_k: int = 5) -> List[Dict[str, Any]]:
-    """Match resume text to jobs using FAISS and keyword overlap."""
+def skill_vectors() -> Dict[str, np.ndarray]:
+    """Normalized embeddings of every canonical skill name, encoded once per process."""
+    global _SKILL_VECTORS
+    if _SKILL_VECTORS is None:
+        names = list(SKILLS)
+        vectors = get_model().encode(names, normalize_embeddings=True, batch_size=max(1, len(names)))
+        _SKILL_VECTORS = dict(zip(names, vectors.astype(np.float32)))
+    return _SKILL_VECTORS
+
+def split_sentences(text: str) -> List[str]:
+    """Sentence and line fragments of the resume, each short enough for the encoder's sequence limit."""
+    parts = (s.strip() for s in re.split(r"(?<=[.!?])\s+|\n", text))  # keeps Node.js, .NET, 3.11 intact
+    return [s[:300] for s in parts if len(s) > 2][:MAX_RESUME_SENTENCES]
+
+def encode_sentences(text: str) -> Tuple[List[str], np.ndarray]:
+    """Encode every resume sentence in a single batch; returns the sentences and their normalized vectors."""
+    sentences = split_sentences(text) or [text[:300]]
+    vectors = get_model().encode(sentences, normalize_embeddings=True, batch_size=len(sentences))
+    return sentences, vectors.astype(np.float32)
+
+def pool(vectors: np.ndarray) -> np.ndarray:
+    """Renormalized mean of the sentence vectors: the resume embedding used for matching."""
+    v = vectors.mean(axis=0)
+    return (v / max(float(np.linalg.norm(v)), 1e-12)).astype(np.float32)
+
+def encode_resume(resume_text: str) -> np.ndarray:
+    """Normalized float32 resume embedding; persisted with the analysis so it can be re-scored later."""
+    return pool(encode_sentences(resume_text)[1])
+
+def score_matches(snapshot, scores: np.ndarray, idxs: np.ndarray, have: set) -> List[Dict[str, Any]]:
+    """Blend one row of catalog search results with keyword overlap against the resume's skills."""
+    results = []
+    for sc, ix in zip(scores, idxs):
+        if ix < 0:
+            continue
+        job = snapshot.job_at(int(ix))
+        required = set(job.get("requiredSkills", []))
+        overlap = required & have
+        miss = sorted(list(required - have))
+        kw_score = len(overlap) / max(1, len(required))
+        final = 0.7 * float(sc) + 0.3 * kw_score
+        results.append({
+            "job_id": job["id"],
+            "title": job.get("title", "Unknown"),
+            "company": job.get("company", "Unknown"),
+            "score": round(final, 3),
+            "matched_skills": sorted(list(overlap)),
+            "missing_skills": miss,
+            "description": job.get("description", "")[:240],
+            "salaryRange": job.get("salaryRange", "Unknown")
+        })
+    return sorted(results, key=lambda x: x["score"], reverse=True)
+
+def match_jobs(
+    resume_text: str,
+    top_k: int = 5,
+    embedding: Optional[np.ndarray] = None,
+    skills: Optional[List[str]] = None,
+) -> List[Dict[str, Any]]:
+    """Match resume text to jobs by binary-code search over the catalog and keyword overlap.
+
+    Pass `skills` when extract_skills has already run on the same text, so it is not repeated.
+    """
+    snapshot = catalog.current()
     try:
-        model, index = get_model_and_index()
-        with torch.no_grad():
-            q = model.encode([resume_text[:10000]], normalize_embeddings=True)  # Cap input
-            q = quantize_embeddings(q, precision="binary").astype("float32")
-        scores, idxs = index.search(q, top_k)
-        results = []
-        for sc, ix in zip(scores[0], idxs[0]):
-            job = JOBS[int(ix)]
-            required = set(job.get("requiredSkills", []))
-            have = set(extract_skills(resume_text))
-            overlap = required & have
-            miss = sorted(list(required - have))
-            kw_score = len(overlap) / max(1, len(required))
-            final = 0.7 * float(sc) + 0.3 * kw_score
-            results.append({
-                "title": job.get("title", "Unknown"),
-                "company": job.get("company", "Unknown"),
-                "score": round(final, 3),
-                "matched_skills": sorted(list(overlap)),
-                "missing_skills": miss,
-                "description": job.get("description", "")[:240],
-                "salaryRange": job.get("salaryRange", "Unknown")
-            })
-        sorted_results = sorted(results, key=lambda x: x["score"], reverse=True)
+        if embedding is None:
+            embedding = encode_resume(resume_text)
+        q = encoders.quantize_binary(embedding[None, :]).astype("float32")
+        scores, idxs = snapshot.search(q, top_k)
+        if skills is None:
+            skills = extract_skills(resume_text)
+        sorted_results = score_matches(snapshot, scores[0], idxs[0], set(skills))
+        if not sorted_results:
+            logger.warning("No jobs matched; catalog is empty")
+            return sorted_results
         logger.info(f"Matched {len(sorted_results)} jobs, top job: {sorted_results[0]['title']} - {sorted_results[0]['company']} with missing skills: {sorted_results[0]['missing_skills']}")
-        gc.collect()
-        torch.cuda.empty_cache() if torch.cuda.is_available() else None
         return sorted_results
     except Exception as e:
         logger.error(f"Job matching failed: {str(e)}")
         raise ValueError(f"Job matching failed: {str(e)}")
 
-@profile
+def collect_missing(matched_jobs: List[Dict[str, Any]]) -> List[str]:
+    """Missing skills across matches, in match order, without duplicates."""
+    missing, seen = [], set()
+    for job in matched_jobs:
+        for skill in job.get("missing_skills", []):
+            if skill not in seen:
+                missing.append(skill)
+                seen.add(skill)
+    return missing
+
+def prioritize_skills(missing_skills: List[str], matched_jobs: List[Dict[str, Any]]) -> List[str]:
+    """Top job's missing skills first, then the rest; at most 8 weeks."""
+    prioritized_skills = []
+    if matched_jobs:
+        top_job_missing = matched_jobs[0]["missing_skills"]
+        prioritized_skills.extend(top_job_missing)
+        prioritized_skills.extend([s for s in missing_skills if s not in top_job_missing])
+    else:
+        prioritized_skills = missing_skills
+    return list(dict.fromkeys(prioritized_skills))[:8]
+
+def learning_plan_entry(week: int, skill: str) -> Dict[str, Any]:
+    """One learning plan week, from learning_map.json or a search-link fallback."""
+    map_data = LEARNING_MAP.get(skill, {
+        "resources": [
+            {"title": f"Learn {skill} Basics", "url": f"https://www.youtube.com/search?q=learn+{skill}"},
+            {"title": f"{skill} Official Docs", "url": f"https://google.com/search?q={skill}+official+docs"}
+        ],
+        "project": {
+            "title": f"Build a {skill} Mini Project",
+            "url": f"https://www.google.com/search?q={skill}+project"
+        },
+        "time": "3 days"
+    })
+    return {
+        "week": week,
+        "topic": skill,
+        "resources": map_data["resources"],
+        "project": map_data["project"],
+        "time": map_data["time"]
+    }
+
 def generate_learning_plan(missing_skills: List[str], matched_jobs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
     """Generate a learning plan prioritizing top job's missing skills."""
     try:
@@ -195,70 +277,66 @@ def generate_learning_plan(missing_skills: List[str], matched_jobs: List[Dict[st
             logger.info(f"Top job: {matched_jobs[0]['title']} - {matched_jobs[0]['company']}, missing skills: {matched_jobs[0]['missing_skills']}")
         else:
             logger.warning("No matched jobs provided")
-        prioritized_skills = []
-        if matched_jobs:
-            top_job_missing = matched_jobs[0]["missing_skills"]
-            prioritized_skills.extend(top_job_missing)
-            prioritized_skills.extend([s for s in missing_skills if s not in top_job_missing])
-        else:
-            prioritized_skills = missing_skills
-        prioritized_skills = list(dict.fromkeys(prioritized_skills))[:8]
+        prioritized_skills = prioritize_skills(missing_skills, matched_jobs)
         logger.info(f"Prioritized skills order: {prioritized_skills}")
-        learning_plan = []
-        for i, skill in enumerate(prioritized_skills, 1):
-            map_data = LEARNING_MAP.get(skill, {
-                "resources": [
-                    {"title": f"Learn {skill} Basics", "url": f"https://www.youtube.com/search?q=learn+{skill}"},
-                    {"title": f"{skill} Official Docs", "url": f"https://google.com/search?q={skill}+official+docs"}
-                ],
-                "project": {
-                    "title": f"Build a {skill} Mini Project",
-                    "url": f"https://www.google.com/search?q={skill}+project"
-                },
-                "time": "3 days"
-            })
-            learning_plan.append({
-                "week": i,
-                "topic": skill,
-                "resources": map_data["resources"],
-                "project": map_data["project"],
-                "time": map_data["time"]
-            })
+        learning_plan = [learning_plan_entry(i, skill) for i, skill in enumerate(prioritized_skills, 1)]
         logger.info(f"Generated learning plan with {len(learning_plan)} weeks: {', '.join([p['topic'] for p in learning_plan])}")
-        gc.collect()
         return learning_plan
     except Exception as e:
         logger.error(f"Learning plan generation failed: {str(e)}")
         raise ValueError(f"Learning plan generation failed: {str(e)}")
 
-@profile
-def generate_evidence(text: str, skills: List[str]) -> Dict[str, Any]:
-    """Generate evidence for skills using a generator to reduce memory."""
+def jd_snippets(skill: str) -> List[str]:
+    """Shortened descriptions of the first JD_SNIPPET_LIMIT catalog jobs that require the skill."""
+    return [
+        job["description"][:100] + "..." if len(job["description"]) > 100 else job["description"]
+        for job in catalog.current().jobs_with_skill(skill, JD_SNIPPET_LIMIT)
+    ]
+
+def evidence_confidence(similarity: Optional[float], mentioned: bool, required: bool) -> float:
+    """Blend the best sentence-to-skill similarity with a direct mention and catalog demand; regex-only tiers without one."""
+    if similarity is None:
+        return 0.9 if mentioned and required else 0.7 if mentioned else 0.5
+    return round(0.6 * min(1.0, max(0.0, similarity)) + 0.3 * mentioned + 0.1 * required, 3)
+
+def generate_evidence(
+    text: str,
+    skills: List[str],
+    sentences: Optional[List[str]] = None,
+    sentence_vectors: Optional[np.ndarray] = None,
+    known_similarity: Optional[Dict[str, float]] = None,
+) -> Dict[str, Any]:
+    """Rank resume sentences per skill by similarity to the skill-name embedding; no encoder calls beyond skill_vectors().
+
+    Without sentence vectors (a reused near-duplicate), snippets are the literal mentions and the
+    best-sentence similarity comes from `known_similarity`, the prior analysis's evidence.
+    """
     try:
         evidence_by_skill = {}
-        def sentence_generator():
-            for sentence in re.split(r'[.!?]+', text):
-                s = sentence.strip()
-                if s:
-                    yield s[:100]  # Cap sentence length
-
+        if sentences is None:
+            sentences = split_sentences(text)
+        vectors_by_skill = skill_vectors() if sentence_vectors is not None else {}
         for skill in skills:
-            resume_snippets = []
-            for sentence in sentence_generator():
-                if re.search(r'\b' + re.escape(skill) + r'\b', sentence, re.IGNORECASE):
-                    resume_snippets.append(sentence)
-            jd_snippets = [
-                job["description"][:100] + "..." if len(job["description"]) > 100 else job["description"]
-                for job in JOBS if skill in job.get("requiredSkills", [])
-            ]
-            confidence = 0.9 if resume_snippets and jd_snippets else 0.7 if resume_snippets else 0.5
+            pattern = re.compile(r'\b' + re.escape(skill) + r'\b', re.IGNORECASE)
+            mentions = np.array([bool(pattern.search(s)) for s in sentences], dtype=bool)
+            vec = vectors_by_skill.get(skill)
+            similarity = None
+            if vec is not None and sentence_vectors is not None and len(sentences):
+                sims = sentence_vectors @ vec
+                order = np.argsort(-(sims + mentions))[:EVIDENCE_SNIPPETS]  # literal mentions rank first
+                resume_snippets = [sentences[i][:100] for i in order if mentions[i] or sims[i] >= EVIDENCE_MIN_SIMILARITY]
+                similarity = float(sims.max())
+            else:
+                resume_snippets = [sentences[i][:100] for i in np.flatnonzero(mentions)[:EVIDENCE_SNIPPETS]]
+                similarity = (known_similarity or {}).get(skill)
+            jd = jd_snippets(skill)
             evidence_by_skill[skill] = {
                 "resume": resume_snippets or ["No specific context found in resume"],
-                "jd": jd_snippets or [f"No job requires {skill}"],
-                "confidence": confidence
+                "jd": jd or [f"No job requires {skill}"],
+                "confidence": evidence_confidence(similarity, bool(mentions.any()), bool(jd)),
+                "similarity": round(similarity, 4) if similarity is not None else None,
             }
         logger.info(f"Generated evidence for {len(evidence_by_skill)} skills")
-        gc.collect()
         return evidence_by_skill
     except Exception as e:
         logger.error(f"Evidence generation failed: {str(e)}")
@@ -0,0 +1,19 @@
+import gc
+import os
+
+# Multi-worker serving: the app is imported once in the master (preload_app) and its
+# objects frozen out of the GC before fork, so imported modules stay copy-on-write.
+# The catalog (binary codes, job records, skill postings) is written to ARTIFACT_DIR once,
+# after the port is bound, by whichever worker's warm-up takes the build lock first; every
+# worker then searches the memory-mapped files in place, so it sits once in the page cache.
+# Only the encoder, thread pools and DB connections are per worker.
+bind = f"0.0.0.0:{os.getenv('PORT', '8080')}"
+workers = int(os.getenv("UVICORN_WORKERS", "2"))
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = True
+timeout = int(os.getenv("WORKER_TIMEOUT", "120"))
+graceful_timeout = 30
+
+def when_ready(server):
+    # Keep the collector from touching (and so un-sharing) the preloaded objects in workers
+    gc.freeze()
@@ -32,7 +32,7 @@ async def run_migrations_online():
     )
     async with connectable.connect() as connection:
         await connection.run_sync(do_run_migrations)
-async def do_run_migrations(connection):
+def do_run_migrations(connection):
     context.configure(connection=connection, target_metadata=target_metadata)
     with context.begin_transaction():
         context.run_migrations()
@@ -0,0 +1,20 @@
+"""analysis embedding backend
+
+Revision ID: 1a194d81fd4c
+Revises: d00b8c3c74cc
+Create Date: 2026-10-19 13:26:51.904217
+
+"""
+from typing import Sequence, Union
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+revision: str = '1a194d81fd4c'
+down_revision: Union[str, None] = 'd00b8c3c74cc'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+def upgrade() -> None:
+    # existing rows stay NULL: the backend that produced their vectors is unknown, so re-scoring and dedup skip them
+    op.add_column('analysis', sa.Column('embedding_backend', sqlmodel.sql.sqltypes.AutoString(), nullable=True))
+def downgrade() -> None:
+    op.drop_column('analysis', 'embedding_backend')
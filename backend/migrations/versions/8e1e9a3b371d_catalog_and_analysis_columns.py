@@ -0,0 +1,46 @@
+"""catalog and analysis columns
+
+Revision ID: 8e1e9a3b371d
+Revises: ede009cfe4f1
+Create Date: 2026-10-19 10:12:04.118530
+
+"""
+from typing import Sequence, Union
+from alembic import op
+import sqlalchemy as sa
+revision: str = '8e1e9a3b371d'
+down_revision: Union[str, None] = 'ede009cfe4f1'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+# IF NOT EXISTS throughout: databases that were brought up to date by the old startup DDL already have these
+COLUMNS = [
+    "ALTER TABLE analysis ADD COLUMN IF NOT EXISTS resume_blob BYTEA",
+    "ALTER TABLE analysis ADD COLUMN IF NOT EXISTS top_job_id INTEGER",
+    "ALTER TABLE analysis ADD COLUMN IF NOT EXISTS top_score FLOAT",
+    "ALTER TABLE analysis ADD COLUMN IF NOT EXISTS resume_embedding BYTEA",
+    "ALTER TABLE analysis ADD COLUMN IF NOT EXISTS simhash BIGINT",
+    "ALTER TABLE job ADD COLUMN IF NOT EXISTS external_id VARCHAR",
+    "ALTER TABLE job ADD COLUMN IF NOT EXISTS content_hash VARCHAR",
+    "ALTER TABLE job ADD COLUMN IF NOT EXISTS embedding BYTEA",
+    "ALTER TABLE job ADD COLUMN IF NOT EXISTS embedding_backend VARCHAR",
+    "ALTER TABLE job ADD COLUMN IF NOT EXISTS active BOOLEAN NOT NULL DEFAULT TRUE",
+    "ALTER TABLE job ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP",
+]
+# built CONCURRENTLY so live workers can keep writing while the index is created
+INDEXES = [
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_analysis_user_created ON analysis (user_id, created_at)",
+    "CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS ix_job_external_id ON job (external_id)",
+]
+def upgrade() -> None:
+    for ddl in COLUMNS:
+        op.execute(ddl)
+    with op.get_context().autocommit_block():
+        for ddl in INDEXES:
+            op.execute(ddl)
+def downgrade() -> None:
+    op.execute("DROP INDEX IF EXISTS ix_job_external_id")
+    op.execute("DROP INDEX IF EXISTS ix_analysis_user_created")
+    for column in ("updated_at", "active", "embedding_backend", "embedding", "content_hash", "external_id"):
+        op.drop_column("job", column)
+    for column in ("simhash", "resume_embedding", "top_score", "top_job_id", "resume_blob"):
+        op.drop_column("analysis", column)
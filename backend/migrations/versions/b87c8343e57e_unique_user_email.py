@@ -0,0 +1,56 @@
+"""unique user email
+
+Revision ID: b87c8343e57e
+Revises: 8e1e9a3b371d
+Create Date: 2026-10-19 11:02:47.530914
+
+"""
+from typing import Sequence, Union
+from alembic import op
+import sqlalchemy as sa
+revision: str = 'b87c8343e57e'
+down_revision: Union[str, None] = '8e1e9a3b371d'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+# before the index existed, concurrent first logins could insert the same email twice;
+# the oldest row keeps the account and inherits the others' analyses and GitHub profiles
+MERGE_DUPLICATE_EMAILS = [
+    """
+    CREATE TEMPORARY TABLE user_merge ON COMMIT DROP AS
+    SELECT id AS duplicate_id, MIN(id) OVER (PARTITION BY email) AS keep_id
+    FROM "user" WHERE email IS NOT NULL
+    """,
+    "DELETE FROM user_merge WHERE duplicate_id = keep_id",
+    "UPDATE analysis SET user_id = m.keep_id FROM user_merge m WHERE analysis.user_id = m.duplicate_id",
+    "UPDATE githubprofile SET user_id = m.keep_id FROM user_merge m WHERE githubprofile.user_id = m.duplicate_id",
+    """
+    UPDATE "user" SET name = d.name
+    FROM (
+        SELECT DISTINCT ON (m.keep_id) m.keep_id, u.name
+        FROM user_merge m JOIN "user" u ON u.id = m.duplicate_id
+        WHERE u.name IS NOT NULL
+        ORDER BY m.keep_id, u.id DESC
+    ) d
+    WHERE "user".id = d.keep_id AND "user".name IS NULL
+    """,
+    'DELETE FROM "user" USING user_merge m WHERE "user".id = m.duplicate_id',
+]
+UNIQUE_EMAIL_DDL = """
+DO $$ BEGIN
+    IF NOT EXISTS (
+        SELECT 1 FROM pg_indexes
+        WHERE tablename = 'user' AND indexdef LIKE 'CREATE UNIQUE INDEX % (email)'
+    ) THEN
+        CREATE UNIQUE INDEX uq_user_email ON "user" (email);
+    END IF;
+END $$;
+"""
+def upgrade() -> None:
+    # hold off new sign-ups (reads continue) so no duplicate can slip in between the merge and the index
+    op.execute('LOCK TABLE "user" IN SHARE ROW EXCLUSIVE MODE')
+    for statement in MERGE_DUPLICATE_EMAILS:
+        op.execute(statement)
+    op.execute(UNIQUE_EMAIL_DDL)
+def downgrade() -> None:
+    # merged accounts are not split back apart
+    op.execute("DROP INDEX IF EXISTS uq_user_email")
@@ -0,0 +1,25 @@
+"""shared admission buckets
+
+Revision ID: d00b8c3c74cc
+Revises: b87c8343e57e
+Create Date: 2026-10-19 11:48:15.207663
+
+"""
+from typing import Sequence, Union
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+revision: str = 'd00b8c3c74cc'
+down_revision: Union[str, None] = 'b87c8343e57e'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+def upgrade() -> None:
+    op.create_table('admissionbucket',
+    sa.Column('user_id', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+    sa.Column('tokens', sa.Float(), nullable=False),
+    sa.Column('updated', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('user_id'),
+    prefixes=['UNLOGGED']
+    )
+def downgrade() -> None:
+    op.drop_table('admissionbucket')